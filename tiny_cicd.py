@@ -1,46 +1,234 @@
 """Simple Flask CI/CD pipeline."""
 
-import time
+import json
+import os
 
-from flask import Flask, request
+from flask import Flask, Response, request
 from simple_websocket import Server, ConnectionClosed
 from tiny_cicd_service import TinyCICDService
+from tiny_cicd_queue import JobQueue
+from tiny_cicd_events import format_sse
+from tiny_cicd_metrics import Gauge, registry
 from tiny_cicd_logger import Logger
+import tiny_cicd_config as config
 
 app = Flask(__name__)
 service = TinyCICDService()
 logger = Logger("tiny-cicd")
+job_queue = JobQueue(config.QUEUE_FILE, config.WORKERS, config.JOB_HISTORY_SIZE)
+
+
+def run_ci_job(job):
+    """Runs the CI pipeline for a queued GitHub push."""
+    service.trigger_pipeline(job.params["url"], job.params["repo_name"], job.params.get("after"),
+                             job.params.get("before"), job.id)
+
+
+def run_cd_job(job):
+    """Runs the deployment pipeline for a queued DockerHub push."""
+    service.trigger_deployment_pipeline(job.params["image_tag"], job.id)
+
+
+def cancel_ci_job(job):
+    """Cancels the CI pipeline of a push superseded by a newer one."""
+    service.cancel_run(job.id)
+
+
+def merge_ci_params(superseded_params, params):
+    """Builds the newest commit while keeping the commit range of both pushes."""
+    return {**params, "before": superseded_params.get("before")}
+
+
+def deploy_release(image_tag):
+    """Queues deployment of an image not pushed to Docker Hub, which would otherwise trigger it."""
+    job_queue.enqueue("cd", {"image_tag": image_tag})
+
+
+job_queue.register_handler("ci", run_ci_job, cancel_ci_job, merge_ci_params)
+job_queue.register_handler("cd", run_cd_job)
+
+if config.REGISTRY_MODE != "dockerhub":
+    service.release_listeners.append(deploy_release)
+
+
+def count_active_runs():
+    """Counts runs in progress by kind."""
+    counts = {"ci": 0, "cd": 0}
+    for context in service.get_active_runs():
+        counts[context.kind] = counts.get(context.kind, 0) + 1
+    return counts
+
+
+registry.register(Gauge("tiny_cicd_queue_depth", "Jobs waiting for a worker.", job_queue.depth))
+registry.register(Gauge("tiny_cicd_workers", "Worker threads running queued jobs.", lambda: config.WORKERS))
+registry.register(Gauge("tiny_cicd_active_runs", "Runs in progress.", count_active_runs, ("kind",)))
+registry.register(Gauge("tiny_cicd_status_clients", "Connected status clients.", service.event_bus.get_subscriber_count))
+
+
+class WebSocketResponse(Response):
+    """Response ending a websocket handler, written only by the development server."""
+
+    def __call__(self, environ, start_response):
+        # Other servers handed the connection over to the websocket and must not write to it anymore
+        if "werkzeug.socket" in environ:
+            return super().__call__(environ, start_response)
+        return []
 
 
 @app.route("/status", websocket=True)
 def status():
-    """Get CI/CD service status."""
-    ws = Server(request.environ)
+    """Push CI/CD service status on every change along with the output of active runs."""
+    repo_name = request.args.get("repo")
+    ws = Server(request.environ, ping_interval=config.STATUS_KEEPALIVE)
+    subscription = service.event_bus.subscribe(repo_name)
+    last_status = None
 
     try:
-        while True:
-            ws.send(service.get_status())
-            time.sleep(5)
+        while ws.connected:
+            current_status = service.get_status(repo_name)
+            if current_status != last_status:
+                ws.send(current_status)
+                last_status = current_status
+
+            output = {}
+            for event in subscription.get(config.STATUS_KEEPALIVE):
+                if event["type"] == "output":
+                    output.setdefault(event["data"]["run_id"], []).append(event["data"]["line"])
+
+            for run_id, lines in output.items():
+                ws.send(json.dumps({"run_id": run_id, "output": lines}))
     except ConnectionClosed:
         pass
+    finally:
+        service.event_bus.unsubscribe(subscription)
+        ws.close()
+
+    return WebSocketResponse()
+
+
+@app.route("/events")
+def events():
+    """Stream stage transitions and output of the runs as server-sent events."""
+    repo_name = request.args.get("repo")
+    subscription = service.event_bus.subscribe(repo_name)
+
+    def stream():
+        try:
+            yield format_sse({"id": 0, "type": "snapshot", "data": json.loads(service.get_status(repo_name))})
+            while True:
+                events = subscription.get(config.STATUS_KEEPALIVE)
+                if not events:
+                    yield ": keepalive\n\n"
+                for event in events:
+                    yield format_sse(event)
+        finally:
+            service.event_bus.unsubscribe(subscription)
+
+    return Response(stream(), 200, {"Content-Type": "text/event-stream", "Cache-Control": "no-cache",
+                                    "X-Accel-Buffering": "no"})
 
 
 @app.route("/details")
 def details():
-    """Get CI/CD service details."""
-    return service.get_pipeline_details(), 200, {"Content-Type": "application/json"}
+    """Get CI/CD service details, optionally for a single repository."""
+    return service.get_pipeline_details(request.args.get("repo")), 200, {"Content-Type": "application/json"}
 
 
 @app.route("/pipeline-status")
 def pipeline_status():
-    """Get CI/CD pipeline status."""
-    return service.get_status(), 200, {"Content-Type": "application/json"}
+    """Get CI/CD pipeline status, optionally for a single repository."""
+    return service.get_status(request.args.get("repo")), 200, {"Content-Type": "application/json"}
 
 
 @app.route("/status/last-deploy")
 def last_deploy():
-    """Get last deploy status."""
-    return service.get_last_deployment_details(), 200, {"Content-Type": "application/json"}
+    """Get last deploy status, optionally for a single repository."""
+    return service.get_last_deployment_details(request.args.get("repo")), 200, {"Content-Type": "application/json"}
+
+
+def get_page():
+    """Returns limit and offset of the requested page of a list."""
+    limit = min(max(request.args.get("limit", config.RUN_PAGE_SIZE, type=int), 1), config.RUN_PAGE_SIZE_MAX)
+    offset = max(request.args.get("offset", 0, type=int), 0)
+    return limit, offset
+
+
+@app.route("/runs")
+def runs():
+    """Get history of pipeline runs, newest first, optionally for a single repository, commit or kind."""
+    limit, offset = get_page()
+    data = service.get_run_history(request.args.get("repo"), request.args.get("commit"), request.args.get("kind"),
+                                   limit, offset)
+    return data, 200, {"Content-Type": "application/json"}
+
+
+@app.route("/deployments")
+def deployments():
+    """Get history of deployments, newest first, optionally for a single image."""
+    limit, offset = get_page()
+    return service.get_run_history(request.args.get("repo"), kind="cd", limit=limit, offset=offset), 200, \
+        {"Content-Type": "application/json"}
+
+
+@app.route("/runs/<run_id>")
+def run_details(run_id):
+    """Get details of a single pipeline run."""
+    data = service.get_run_details(run_id)
+    if data is None:
+        return json.dumps({"error": "Run not found"}), 404, {"Content-Type": "application/json"}
+    return json.dumps(data), 200, {"Content-Type": "application/json"}
+
+
+@app.route("/runs/<run_id>/output")
+def run_output(run_id):
+    """Get the most recent build and test output of a pipeline run."""
+    context = service.get_run(run_id)
+    if context is None:
+        return json.dumps({"error": "Run not found"}), 404, {"Content-Type": "application/json"}
+    return json.dumps(list(context.output)), 200, {"Content-Type": "application/json"}
+
+
+@app.route("/runs/<run_id>/log")
+def run_log(run_id):
+    """Get the structured log of a pipeline run, one JSON record per line."""
+    names = os.listdir(config.LOG_DIR) if config.LOG_DIR and os.path.isdir(config.LOG_DIR) else []
+    name = next((name for name in names if name.endswith(f"-{run_id}.log")), None)
+    if name is None:
+        return json.dumps({"error": "Log not found"}), 404, {"Content-Type": "application/json"}
+    with open(os.path.join(config.LOG_DIR, name), 'r', encoding="UTF-8") as file:
+        return file.read(), 200, {"Content-Type": "application/x-ndjson"}
+
+
+@app.route("/runs/<run_id>/tests")
+def run_test_results(run_id):
+    """Get test results of a pipeline run with per-test durations."""
+    context = service.get_run(run_id)
+    if context is None:
+        return json.dumps({"error": "Run not found"}), 404, {"Content-Type": "application/json"}
+    data = {"summary": context.test_summary, "results": context.test_results}
+    return json.dumps(data), 200, {"Content-Type": "application/json"}
+
+
+@app.route("/metrics")
+def metrics():
+    """Get stage durations, queue depth, concurrent runs and cache lookups in the Prometheus format."""
+    return registry.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+@app.route("/jobs")
+def jobs():
+    """Get queued, running and recently finished jobs."""
+    data = [job.to_dict() for job in job_queue.get_jobs()]
+    return json.dumps(data), 200, {"Content-Type": "application/json"}
+
+
+@app.route("/jobs/<job_id>")
+def job_details(job_id):
+    """Get status of a queued job."""
+    job = job_queue.get_job(job_id)
+    if job is None:
+        return json.dumps({"error": "Job not found"}), 404, {"Content-Type": "application/json"}
+    return job.to_json(), 200, {"Content-Type": "application/json"}
 
 
 @app.route("/webhook-github", methods=["POST"])
@@ -53,16 +241,27 @@ def github_webhook():
     repo_name = payload["payload"]["repository"]["name"]
     last_commit = payload["payload"]["after"]
     previous_commit = payload["payload"]["before"]
+    branch = payload["payload"].get("ref", "")
 
-    service.trigger_pipeline(url, repo_name)
+    job = job_queue.enqueue("ci", {
+        "url": url,
+        "repo_name": repo_name,
+        "after": last_commit,
+        "before": previous_commit,
+        "branch": branch
+    }, coalesce_key=f"{repo_name}:{branch}")
 
-    return "OK", 200, {"Content-Type": "application/json"}
+    return json.dumps({"job_id": job.id}), 202, {"Content-Type": "application/json"}
 
 
 @app.route("/webhook-dockerhub", methods=["POST"])
 def dockerhub_webhook():
     """Receive DockerHub push event."""
 
+    if config.REGISTRY_MODE != "dockerhub":
+        # Images mirrored to Docker Hub were already deployed by the pipeline that built them
+        return json.dumps({"job_id": None}), 200, {"Content-Type": "application/json"}
+
     payload = request.get_json()
 
     pushed_at = payload["push_data"]["pushed_at"]
@@ -75,9 +274,9 @@ def dockerhub_webhook():
     repo_name = payload["repository"]["repo_name"]
     repo_url = payload["repository"]["repo_url"]
 
-    service.trigger_deployment_pipeline((repo_name + ":" + tag))
+    job = job_queue.enqueue("cd", {"image_tag": repo_name + ":" + tag})
 
-    return "OK", 200, {"Content-Type": "application/json"}
+    return json.dumps({"job_id": job.id}), 202, {"Content-Type": "application/json"}
 
 
 @app.route("/shutdown", methods=["POST"])
@@ -90,4 +289,8 @@ def shutdown():
 
 
 if __name__ == '__main__':
-    app.run(host="0.0.0.0", port=5050, debug=True)
+    # With debug=True the reloader runs the app in a child process, start workers only there
+    if not config.DEBUG or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        service.restore_deployments()
+        job_queue.start()
+    app.run(host=config.SERVER_HOST, port=config.SERVER_PORT, debug=config.DEBUG)
@@ -0,0 +1,74 @@
+"""Build result cache for tiny CI/CD pipelines."""
+
+import hashlib
+import json
+import os
+import threading
+
+from tiny_cicd_logger import Logger
+
+
+def get_cache_key(*parts):
+    """Returns a key identifying the build inputs."""
+    return hashlib.sha256("\0".join(str(part) for part in parts).encode("UTF-8")).hexdigest()
+
+
+class ResultCache:
+    """Test outcomes and resulting images of already built source trees, kept on disk."""
+
+    logger = Logger("ResultCache")
+
+    def __init__(self, path, size):
+        self.path = path
+        self.size = size
+        self.lock = threading.Lock()
+        self.entries = self.load()
+
+    def load(self):
+        """Reads cached results from disk."""
+
+        if not os.path.exists(self.path):
+            return {}
+
+        try:
+            with open(self.path, 'r', encoding="UTF-8") as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            self.logger.log(f"Failed to load build result cache: {e}", "error")
+            return {}
+
+    def get(self, key):
+        """Returns the cached result or None."""
+
+        with self.lock:
+            return self.entries.get(key)
+
+    def put(self, key, result):
+        """Stores a result, forgetting the oldest ones above the cache size."""
+
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = result
+
+            while len(self.entries) > self.size:
+                del self.entries[next(iter(self.entries))]
+
+            self.persist()
+
+    def remove(self, key):
+        """Forgets a result whose image is gone."""
+
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.persist()
+
+    def persist(self):
+        """Writes cached results to disk."""
+
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(f"{self.path}.tmp", 'w', encoding="UTF-8") as file:
+                json.dump(self.entries, file)
+            os.replace(f"{self.path}.tmp", self.path)
+        except OSError as e:
+            self.logger.log(f"Failed to persist build result cache: {e}", "error")
@@ -0,0 +1,154 @@
+"""Configuration of the tiny CI/CD pipeline read from environmental variables."""
+
+import os
+
+# Number of worker threads draining the pipeline job queue
+WORKERS = int(os.environ.get("TINY_CICD_WORKERS", os.cpu_count() or 1))
+
+# File keeping queued and running jobs so they survive a restart
+QUEUE_FILE = os.environ.get("TINY_CICD_QUEUE_FILE", os.path.join("deployments", ".queue.json"))
+
+# Amount of finished jobs kept in memory for the /jobs endpoint
+JOB_HISTORY_SIZE = int(os.environ.get("TINY_CICD_JOB_HISTORY_SIZE", "100"))
+
+# How code is fetched: "clone" clones and pulls a checkout per repository, "mirror" fetches
+# the pushed commit into a bare mirror per repository and checks it out into a worktree per run
+GIT_FETCH_MODE = os.environ.get("TINY_CICD_GIT_FETCH_MODE", "clone")
+
+# Directory keeping bare mirrors of the repositories in "mirror" mode
+GIT_MIRROR_DIR = os.environ.get("TINY_CICD_GIT_MIRROR_DIR", os.path.join("deployments", ".mirrors"))
+
+# Fetch only the pushed commit without its history in "mirror" mode
+GIT_SHALLOW = os.environ.get("TINY_CICD_GIT_SHALLOW", "true").lower() == "true"
+
+# Partial clone filter used when fetching in "mirror" mode, e.g. "blob:none"
+GIT_FILTER = os.environ.get("TINY_CICD_GIT_FILTER", "")
+
+# Directory keeping worktrees of the mirrors in "mirror" mode
+GIT_WORKTREE_DIR = os.environ.get("TINY_CICD_GIT_WORKTREE_DIR", os.path.join("deployments", ".worktrees"))
+
+# Amount of worktrees kept per repository, least recently used ones above it are removed
+GIT_WORKTREE_POOL_SIZE = int(os.environ.get("TINY_CICD_GIT_WORKTREE_POOL_SIZE", "4"))
+
+# How test and release images are built: "separate" builds the test image from the test-runner
+# template, "multistage" builds it from the test stage of the project's own Dockerfile when it
+# declares one, so the dependency stage is built once for both images
+BUILD_MODE = os.environ.get("TINY_CICD_BUILD_MODE", "separate")
+
+# Stage of the project's Dockerfile running the tests in "multistage" mode
+TEST_TARGET = os.environ.get("TINY_CICD_TEST_TARGET", "test")
+
+# Stage of the project's Dockerfile built as the release image, the last stage if empty
+RELEASE_TARGET = os.environ.get("TINY_CICD_RELEASE_TARGET", "")
+
+# Size the BuildKit dependency cache mounts are pruned to after every run, e.g. "5GB", empty to disable
+BUILD_CACHE_MAX_SIZE = os.environ.get("TINY_CICD_BUILD_CACHE_MAX_SIZE", "5GB")
+
+# Maximum amount of pooled HTTP connections of the shared Docker client
+DOCKER_POOL_SIZE = int(os.environ.get("TINY_CICD_DOCKER_POOL_SIZE", max(10, WORKERS * 2)))
+
+# Directory keeping durations of the tests of each repository from their most recent runs
+TEST_DURATIONS_DIR = os.environ.get("TINY_CICD_TEST_DURATIONS_DIR", os.path.join("deployments", ".test-durations"))
+
+# Amount of parallel containers the test suite is split into, 1 runs it in a single container
+TEST_SHARDS = int(os.environ.get("TINY_CICD_TEST_SHARDS", "1"))
+
+# CPUs available to each test shard container, e.g. "1.5", empty for no limit
+TEST_SHARD_CPUS = float(os.environ.get("TINY_CICD_TEST_SHARD_CPUS") or 0)
+
+# Memory available to each test shard container, e.g. "1g", empty for no limit
+TEST_SHARD_MEMORY = os.environ.get("TINY_CICD_TEST_SHARD_MEMORY", "")
+
+# Run only the tests affected by the files changed between the pushed commits
+TEST_IMPACT = os.environ.get("TINY_CICD_TEST_IMPACT", "false").lower() == "true"
+
+# Every how many runs of a repository the whole test suite runs in test impact mode
+TEST_IMPACT_FULL_RUN_EVERY = int(os.environ.get("TINY_CICD_TEST_IMPACT_FULL_RUN_EVERY", "10"))
+
+# Reuse the image built from an identical source tree instead of testing and building it again
+RESULT_CACHE = os.environ.get("TINY_CICD_RESULT_CACHE", "true").lower() == "true"
+
+# File keeping results of built source trees
+RESULT_CACHE_FILE = os.environ.get("TINY_CICD_RESULT_CACHE_FILE", os.path.join("deployments", ".cache", "results.json"))
+
+# Amount of built source trees remembered, the oldest ones above it are forgotten
+RESULT_CACHE_SIZE = int(os.environ.get("TINY_CICD_RESULT_CACHE_SIZE", "500"))
+
+# Depth of the directories searched for projects of a monorepo, 0 detects only the root project
+PROJECT_DETECTION_DEPTH = int(os.environ.get("TINY_CICD_PROJECT_DETECTION_DEPTH", "2"))
+
+# Amount of subprojects of a monorepo built at the same time by a single run
+MONOREPO_CONCURRENCY = int(os.environ.get("TINY_CICD_MONOREPO_CONCURRENCY", WORKERS))
+
+# Events kept for a status client which does not keep up, the oldest ones above it are dropped
+STATUS_SUBSCRIPTION_SIZE = int(os.environ.get("TINY_CICD_STATUS_SUBSCRIPTION_SIZE", "1000"))
+
+# Seconds between keepalive messages to idle status clients
+STATUS_KEEPALIVE = float(os.environ.get("TINY_CICD_STATUS_KEEPALIVE", "15"))
+
+# Address and port the pipeline listens on
+SERVER_HOST = os.environ.get("TINY_CICD_SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.environ.get("TINY_CICD_SERVER_PORT", "5050"))
+
+# Run the development server with debugger and reloader
+DEBUG = os.environ.get("TINY_CICD_DEBUG", "true").lower() == "true"
+
+# Seconds the production server waits for running pipelines to finish on shutdown
+SHUTDOWN_TIMEOUT = float(os.environ.get("TINY_CICD_SHUTDOWN_TIMEOUT", "600"))
+
+# SQLite database keeping the history of the runs
+RUN_STORE_FILE = os.environ.get("TINY_CICD_RUN_STORE_FILE", os.path.join("deployments", ".runs.sqlite3"))
+
+# Runs returned per page of the run history, by default and at most
+RUN_PAGE_SIZE = int(os.environ.get("TINY_CICD_RUN_PAGE_SIZE", "20"))
+RUN_PAGE_SIZE_MAX = int(os.environ.get("TINY_CICD_RUN_PAGE_SIZE_MAX", "200"))
+
+# Format of the log written to the console, "text" or "json"
+LOG_FORMAT = os.environ.get("TINY_CICD_LOG_FORMAT", "text")
+
+# Directory with the log files of the runs, empty to log only to the console
+LOG_DIR = os.environ.get("TINY_CICD_LOG_DIR", os.path.join("deployments", ".logs"))
+
+# Size at which a run's log file is rotated and the amount of rotated files kept per run
+LOG_FILE_MAX_BYTES = int(os.environ.get("TINY_CICD_LOG_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+LOG_FILE_BACKUPS = int(os.environ.get("TINY_CICD_LOG_FILE_BACKUPS", "3"))
+
+# Amount of runs whose log files are kept, the oldest ones above it are removed
+LOG_RUN_FILES_KEEP = int(os.environ.get("TINY_CICD_LOG_RUN_FILES_KEEP", "200"))
+
+# Seconds between logged lines of a progress stream, e.g. of an image push
+LOG_PROGRESS_INTERVAL = float(os.environ.get("TINY_CICD_LOG_PROGRESS_INTERVAL", "2"))
+
+# How images are deployed: "recreate" stops the deployed container before starting the new one,
+# "blue-green" starts the new one next to it and switches a local proxy to it once it is healthy
+DEPLOY_STRATEGY = os.environ.get("TINY_CICD_DEPLOY_STRATEGY", "recreate")
+
+# Port the deployed application is published on, and the port it listens on in its container
+DEPLOY_PORT = int(os.environ.get("TINY_CICD_DEPLOY_PORT", "5000"))
+DEPLOY_CONTAINER_PORT = int(os.environ.get("TINY_CICD_DEPLOY_CONTAINER_PORT", "5000"))
+
+# Ports the blue and green containers are published on behind the proxy
+DEPLOY_SLOT_PORTS = [int(port) for port in os.environ.get("TINY_CICD_DEPLOY_SLOT_PORTS", "5001,5002").split(",")]
+
+# Host the proxy and the health checks reach the published containers on
+DEPLOY_HOST = os.environ.get("TINY_CICD_DEPLOY_HOST", "127.0.0.1")
+
+# Health check of a new container: path requested, seconds to wait for it to pass and between attempts
+DEPLOY_HEALTH_PATH = os.environ.get("TINY_CICD_DEPLOY_HEALTH_PATH", "/")
+DEPLOY_HEALTH_TIMEOUT = float(os.environ.get("TINY_CICD_DEPLOY_HEALTH_TIMEOUT", "60"))
+DEPLOY_HEALTH_INTERVAL = float(os.environ.get("TINY_CICD_DEPLOY_HEALTH_INTERVAL", "1"))
+
+# Seconds to wait for open connections to the previous container before stopping it
+DEPLOY_DRAIN_TIMEOUT = float(os.environ.get("TINY_CICD_DEPLOY_DRAIN_TIMEOUT", "30"))
+
+# Start pulling an image for its deployment as soon as it is pushed, and how many images are pulled at once
+DEPLOY_PREPULL = os.environ.get("TINY_CICD_DEPLOY_PREPULL", "true").lower() == "true"
+DEPLOY_PREPULL_CONCURRENCY = int(os.environ.get("TINY_CICD_DEPLOY_PREPULL_CONCURRENCY", "2"))
+
+# Where built images are pushed: "dockerhub", "local" for the registry at LOCAL_REGISTRY,
+# or "none" to deploy the built image on this host without pushing it anywhere
+REGISTRY_MODE = os.environ.get("TINY_CICD_REGISTRY_MODE", "dockerhub")
+LOCAL_REGISTRY = os.environ.get("TINY_CICD_LOCAL_REGISTRY", "localhost:5500")
+
+# Push images to Docker Hub in the background as well when not using it as the registry
+REGISTRY_MIRROR = os.environ.get("TINY_CICD_REGISTRY_MIRROR", "false").lower() == "true"
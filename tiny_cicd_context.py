@@ -0,0 +1,208 @@
+"""Per-run state of tiny CI/CD pipelines."""
+
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+
+class PipelineCancelled(Exception):
+    """Raised when a run is cancelled because a newer commit superseded it."""
+
+
+# Amount of the most recent output lines kept per run
+output_size = 500
+
+
+# Run handled by the current thread
+current_run = threading.local()
+
+
+def now():
+    """Returns current UTC time in ISO format."""
+    return datetime.now(timezone.utc).isoformat()
+
+
+def get_current_context():
+    """Returns context of the run handled by the current thread or None."""
+    return getattr(current_run, "context", None)
+
+
+@contextmanager
+def run_scope(context):
+    """Marks the current thread as handling the run while inside the block."""
+
+    previous_context = get_current_context()
+    current_run.context = context
+
+    try:
+        yield context
+    finally:
+        current_run.context = previous_context
+
+
+class PipelineContext:
+    """State of a single pipeline run, one per job, keyed by repository and commit."""
+
+    def __init__(self, kind, repo_name, repo_url="", commit=None, before=None, run_id=None):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.kind = kind
+        self.repo_name = repo_name
+        self.repo_url = repo_url
+        self.commit = commit
+        self.before = before
+        self.repo_directory = ""
+        self.project_type = ""
+        self.projects = []
+        self.project_path = ""
+        self.parent_run_id = None
+        self.subprojects = []
+        self.changed_files = None
+        self.image_tag = None
+        self.test_image_tag = None
+        self.deployed_container_id = None
+        self.status = "TRIGGERED"
+        self.stages = []
+        self.stage_started = None
+        self.spans = []
+        self.build_steps = []
+        self.docker_api_calls = 0
+        self.output = deque(maxlen=output_size)
+        self.test_results = []
+        self.test_summary = None
+        self.test_selection = None
+        self.cache_key = None
+        self.cache_hit = False
+        self.error = None
+        self.created_at = now()
+        self.created = time.monotonic()
+        self.seconds = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.cancel_callbacks = []
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    @property
+    def key(self):
+        """Returns the repository and commit the run is keyed by."""
+        return f"{self.repo_name}@{self.commit or 'HEAD'}"
+
+    def set_status(self, status):
+        """Moves the run to the next stage."""
+        self.end_stage()
+        self.status = status
+        self.stages.append({"stage": status, "started_at": now(), "seconds": None})
+        self.stage_started = time.monotonic()
+        self.notify("status")
+
+    def end_stage(self):
+        """Records how long the current stage took."""
+        if self.stages and self.stages[-1]["seconds"] is None:
+            self.stages[-1]["seconds"] = round(time.monotonic() - self.stage_started, 3)
+            self.notify("stage", self.stages[-1])
+
+    def append_output(self, line):
+        """Keeps a line of build or test output of the run."""
+        with self.lock:
+            self.output.append(line)
+        self.notify("output", line)
+
+    def finish(self, error=None):
+        """Marks the run as finished."""
+        self.end_stage()
+        self.seconds = round(time.monotonic() - self.created, 3)
+        self.error = error
+        if self.is_cancelled():
+            self.status = "CANCELLED"
+        else:
+            self.status = "FAILED" if error else "FINISHED"
+        self.finished_at = now()
+        self.notify("status")
+
+    def notify(self, event_type, payload=None):
+        """Tells the listeners about a change of the run."""
+        for listener in self.listeners:
+            listener(self, event_type, payload)
+
+    def cancel(self):
+        """Cancels the run, aborting the step currently in progress."""
+
+        with self.lock:
+            self.cancel_event.set()
+            callbacks = list(self.cancel_callbacks)
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def is_cancelled(self):
+        """Checks if the run was cancelled."""
+        return self.cancel_event.is_set()
+
+    def check_cancelled(self):
+        """Raises PipelineCancelled if the run was cancelled."""
+        if self.is_cancelled():
+            raise PipelineCancelled(f"Run {self.run_id} for {self.key} was cancelled")
+
+    @contextmanager
+    def cancellable(self, callback):
+        """Calls the callback if the run gets cancelled while inside the block."""
+
+        with self.lock:
+            self.cancel_callbacks.append(callback)
+            cancelled = self.cancel_event.is_set()
+
+        if cancelled:
+            callback()
+
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.cancel_callbacks.remove(callback)
+
+    def is_active(self):
+        """Checks if the run has not finished yet."""
+        return self.finished_at is None
+
+    def to_dict(self):
+        """Converts run details to a dictionary."""
+        return {
+            "run_id": self.run_id,
+            "kind": self.kind,
+            "key": self.key,
+            "status": self.status,
+            "repo_name": self.repo_name,
+            "repo_url": self.repo_url,
+            "repo_directory": self.repo_directory,
+            "commit": self.commit,
+            "before": self.before,
+            "project_type": self.project_type,
+            "projects": self.projects,
+            "project_path": self.project_path,
+            "parent_run_id": self.parent_run_id,
+            "subprojects": self.subprojects,
+            "image_tag": self.image_tag,
+            "deployed_container_id": self.deployed_container_id,
+            "stages": self.stages,
+            "build_steps": self.build_steps,
+            "spans": self.spans,
+            "docker_api_calls": self.docker_api_calls,
+            "test_summary": self.test_summary,
+            "test_selection": self.test_selection,
+            "cache_hit": self.cache_hit,
+            "error": self.error,
+            "created_at": self.created_at,
+            "seconds": self.seconds,
+            "finished_at": self.finished_at
+        }
+
+    def to_json(self):
+        """Converts run details to JSON format."""
+        return json.dumps(self.to_dict())
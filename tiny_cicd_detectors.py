@@ -0,0 +1,237 @@
+"""Project type detection for tiny CI/CD pipelines."""
+
+import hashlib
+import os
+import subprocess
+import threading
+
+from tiny_cicd_logger import Logger
+import tiny_cicd_metrics as metrics
+
+# Directories never containing projects of the repository
+skipped_directories = {".git", "node_modules", "target", "build", "bin", "obj", "vendor", "__pycache__", ".venv",
+                       "venv", "dist"}
+
+# Extensions of files outside the projects which never affect them
+documentation_extensions = (".md", ".rst", ".adoc")
+
+# Registered detectors in the order they are tried
+detectors = []
+
+
+def register_detector(detector_class):
+    """Class decorator adding the detector to the registry."""
+    detectors.append(detector_class())
+    return detector_class
+
+
+class ProjectDetector:
+    """Recognizes a project type by the files in the project directory."""
+
+    project_type = "UNSUPPORTED"
+    manifests = ()
+    suffixes = ()
+
+    def is_manifest(self, name):
+        """Checks if the file name identifies the project type."""
+        return name in self.manifests or (bool(self.suffixes) and name.endswith(self.suffixes))
+
+    def matches(self, file_names):
+        """Checks if a directory with the given files is a project of this type."""
+        return any(self.is_manifest(name) for name in file_names)
+
+
+@register_detector
+class MavenDetector(ProjectDetector):
+    """Detects Maven projects by pom.xml."""
+    project_type = "MAVEN"
+    manifests = ("pom.xml",)
+
+
+@register_detector
+class DotnetDetector(ProjectDetector):
+    """Detects .NET projects by project, solution or C# source files."""
+    project_type = "DOTNET"
+    suffixes = (".csproj", ".sln", ".cs")
+
+
+@register_detector
+class PythonDetector(ProjectDetector):
+    """Detects Python projects by requirements.txt, setup.py or pyproject.toml."""
+    project_type = "PYTHON"
+    manifests = ("requirements.txt", "setup.py", "pyproject.toml")
+
+
+@register_detector
+class GoDetector(ProjectDetector):
+    """Detects Go projects by go.mod."""
+    project_type = "GO"
+    manifests = ("go.mod",)
+
+
+@register_detector
+class GradleDetector(ProjectDetector):
+    """Detects Gradle projects by their build scripts."""
+    project_type = "GRADLE"
+    manifests = ("build.gradle", "build.gradle.kts", "settings.gradle", "settings.gradle.kts")
+
+
+@register_detector
+class NodeDetector(ProjectDetector):
+    """Detects Node projects by package.json."""
+    project_type = "NODE"
+    manifests = ("package.json",)
+
+
+@register_detector
+class RustDetector(ProjectDetector):
+    """Detects Rust projects by Cargo.toml."""
+    project_type = "RUST"
+    manifests = ("Cargo.toml",)
+
+
+def detect_type(file_names):
+    """Returns type of the project consisting of the files, None if no detector recognizes it."""
+
+    for detector in detectors:
+        if detector.matches(file_names):
+            return detector.project_type
+    return None
+
+
+def is_manifest(name):
+    """Checks if any detector recognizes projects by the file."""
+    return any(detector.is_manifest(name) for detector in detectors)
+
+
+def select_affected_projects(projects, changed_files):
+    """Returns projects of a monorepo with changed files, all of them if the changes are unknown.
+
+    A changed file outside every project, e.g. a shared library or build script, affects all
+    projects unless it is documentation.
+    """
+
+    if changed_files is None:
+        return list(projects)
+
+    affected = []
+
+    for path in changed_files:
+        owners = [project for project in projects if path.startswith(f"{project['path']}/")]
+        if owners:
+            affected += [project for project in owners if project not in affected]
+        elif not path.endswith(documentation_extensions):
+            return list(projects)
+
+    return [project for project in projects if project in affected]
+
+
+class ProjectDetectionService:
+    """Detects projects of a repository, caching results per repository.
+
+    The repository is listed once, using the git index of the checkout when available, and
+    results are reused as long as the manifest files keep their content.
+    """
+
+    logger = Logger("ProjectDetectionService")
+
+    def __init__(self, max_depth):
+        self.max_depth = max_depth
+        self.cache = {}
+        self.lock = threading.Lock()
+
+    def detect_projects(self, repo_directory, cache_name=None):
+        """Returns projects of the repository as dictionaries with the relative path and the type.
+
+        A repository recognized at its root is a single project. Otherwise every top-most
+        recognized directory is a project of its own, which makes the repository a monorepo.
+        """
+
+        files = self.list_files(repo_directory)
+        manifests = {path: blob for path, blob in files.items() if is_manifest(path.rsplit("/", 1)[-1])}
+        key = hashlib.sha256(repr(sorted(manifests.items())).encode("UTF-8")).hexdigest()
+        cache_name = cache_name or repo_directory
+
+        with self.lock:
+            cached = self.cache.get(cache_name)
+            if cached is not None and cached[0] == key:
+                metrics.cache_requests.inc(cache="project_detection", result="hit")
+                return cached[1]
+
+        metrics.cache_requests.inc(cache="project_detection", result="miss")
+
+        projects = self.find_projects(manifests)
+
+        self.logger.log(f"Detected projects of {repo_directory}: {projects}", "info")
+
+        with self.lock:
+            self.cache[cache_name] = (key, projects)
+
+        return projects
+
+    def find_projects(self, manifests):
+        """Returns the top-most project directories among the manifest paths."""
+
+        directories = {}
+        for path in manifests:
+            directory = path.rsplit("/", 1)[0] if "/" in path else ""
+            directories.setdefault(directory, []).append(path.rsplit("/", 1)[-1])
+
+        projects = []
+
+        for directory in sorted(directories, key=lambda name: (name.count("/") if name else -1, name)):
+            if any(directory == project["path"] or not project["path"] or directory.startswith(f"{project['path']}/")
+                   for project in projects):
+                continue
+            project_type = detect_type(directories[directory])
+            if project_type is not None:
+                projects.append({"path": directory, "type": project_type})
+
+        return projects
+
+    def list_files(self, repo_directory):
+        """Returns files of the repository up to the maximum depth mapped to their content hashes."""
+
+        try:
+            output = subprocess.run(["git", "ls-files", "-s"], cwd=repo_directory, capture_output=True, text=True,
+                                    check=True).stdout
+            files = {}
+            for line in output.splitlines():
+                info, path = line.split("\t", 1)
+                if self.is_listed(path):
+                    files[path] = info.split()[1]
+            return files
+        except (OSError, subprocess.CalledProcessError):
+            return self.walk_files(repo_directory)
+
+    def is_listed(self, path):
+        """Checks if the path is within the maximum depth and outside skipped directories."""
+
+        parts = path.split("/")
+        return len(parts) <= self.max_depth + 1 and not any(part in skipped_directories for part in parts[:-1])
+
+    def walk_files(self, repo_directory):
+        """Lists files of a directory which is not a git checkout, hashing only the manifests."""
+
+        files = {}
+
+        for root, directories, names in os.walk(repo_directory):
+            relative_root = os.path.relpath(root, repo_directory).replace(os.sep, "/")
+            depth = 0 if relative_root == "." else relative_root.count("/") + 1
+            directories[:] = [] if depth >= self.max_depth else [
+                name for name in directories if name not in skipped_directories]
+            for name in names:
+                path = name if relative_root == "." else f"{relative_root}/{name}"
+                files[path] = self.hash_file(os.path.join(root, name)) if is_manifest(name) else ""
+
+        return files
+
+    @staticmethod
+    def hash_file(path):
+        """Returns SHA-256 of the file content."""
+
+        try:
+            with open(path, 'rb') as file:
+                return hashlib.sha256(file.read()).hexdigest()
+        except OSError:
+            return ""
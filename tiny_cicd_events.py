@@ -0,0 +1,104 @@
+"""Status events of tiny CI/CD pipelines pushed to dashboard clients."""
+
+import json
+import threading
+from collections import deque
+
+from tiny_cicd_context import now
+
+
+class Subscription:
+    """Events waiting to be sent to a single client, optionally of a single repository."""
+
+    def __init__(self, repo_name=None, size=1000):
+        self.repo_name = repo_name
+        self.events = deque(maxlen=size)
+        self.condition = threading.Condition()
+        self.dropped = 0
+
+    def put(self, event):
+        """Queues an event, dropping the oldest one if the client does not keep up."""
+
+        with self.condition:
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1
+            self.events.append(event)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Returns queued events, waiting for at least one up to the timeout."""
+
+        with self.condition:
+            if not self.events:
+                self.condition.wait(timeout)
+            events = list(self.events)
+            self.events.clear()
+            return events
+
+    def accepts(self, event):
+        """Checks if the client is interested in the event."""
+        return self.repo_name is None or event["data"].get("repo_name") == self.repo_name
+
+
+class EventBus:
+    """Publishes events to subscribed clients as they happen, skipping ones repeating the last state."""
+
+    def __init__(self, subscription_size=1000):
+        self.subscription_size = subscription_size
+        self.subscriptions = []
+        self.last_state = {}
+        self.sequence = 0
+        self.lock = threading.Lock()
+
+    def subscribe(self, repo_name=None):
+        """Returns a new subscription receiving events published from now on."""
+
+        subscription = Subscription(repo_name, self.subscription_size)
+
+        with self.lock:
+            self.subscriptions.append(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """Stops delivering events to the subscription."""
+
+        with self.lock:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+
+    def publish(self, event_type, data, state_key=None):
+        """Delivers an event to the subscriptions.
+
+        Events with a state key are dropped when equal to the last event published under the key.
+        """
+
+        with self.lock:
+            if state_key is not None:
+                if self.last_state.get(state_key) == data:
+                    return
+                self.last_state[state_key] = data
+
+            self.sequence += 1
+            event = {"id": self.sequence, "type": event_type, "time": now(), "data": data}
+            subscriptions = [subscription for subscription in self.subscriptions if subscription.accepts(event)]
+
+        for subscription in subscriptions:
+            subscription.put(event)
+
+    def forget(self, state_key):
+        """Forgets the last state published under the key."""
+
+        with self.lock:
+            self.last_state.pop(state_key, None)
+
+    def get_subscriber_count(self):
+        """Returns amount of connected clients."""
+
+        with self.lock:
+            return len(self.subscriptions)
+
+
+def format_sse(event):
+    """Formats the event as a server-sent event."""
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'])}\n\n"
@@ -1,19 +1,189 @@
 """Logger for tiny CI/CD pipelines."""
 
+import atexit
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from tiny_cicd_context import get_current_context
+import tiny_cicd_config as config
+
+# Records waiting to be formatted and written by the listener thread
+log_queue = queue.SimpleQueue()
+log_listener = None
+log_listener_lock = threading.Lock()
+
+
+class RunContextFilter(logging.Filter):
+    """Tags records with the run and stage handled by the logging thread."""
+
+    def filter(self, record):
+        context = get_current_context()
+        record.run_id = context.run_id if context is not None else None
+        record.repo_name = context.repo_name if context is not None else None
+        record.stage = context.status if context is not None else None
+        record.run_created_at = context.created_at if context is not None else None
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single line JSON objects."""
+
+    def format(self, record):
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "run_id": getattr(record, "run_id", None),
+            "repo_name": getattr(record, "repo_name", None),
+            "stage": getattr(record, "stage", None)
+        }
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data)
+
+
+class RunFileHandler(logging.Handler):
+    """Writes records of each run to a rotating file of its own, named after the start of the run and its id.
+
+    Files of the least recently logging runs are closed above the limit of open files, the oldest
+    files are removed above the limit of kept files.
+    """
+
+    def __init__(self, directory, max_bytes, backup_count, keep, open_files=32):
+        super().__init__()
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.keep = keep
+        self.open_files = open_files
+        self.handlers = OrderedDict()
+
+    def get_path(self, record):
+        """Returns path of the log file of the record's run."""
+        started = record.run_created_at[:19].replace("-", "").replace(":", "").replace("T", "-")
+        return os.path.join(self.directory, f"{started}-{record.run_id}.log")
+
+    def get_handler(self, record):
+        """Returns handler writing the file of the record's run, opening it if needed."""
+
+        handler = self.handlers.pop(record.run_id, None)
+
+        if handler is None:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self.get_path(record)
+            if not os.path.exists(path):
+                self.remove_old_files()
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=self.max_bytes,
+                                                           backupCount=self.backup_count, encoding="UTF-8")
+            handler.setFormatter(self.formatter)
+
+        self.handlers[record.run_id] = handler
+
+        while len(self.handlers) > self.open_files:
+            _, oldest = self.handlers.popitem(last=False)
+            oldest.close()
+
+        return handler
+
+    def remove_old_files(self):
+        """Removes log files of the oldest runs above the limit of kept files."""
+
+        names = sorted(name for name in os.listdir(self.directory) if ".log" in name)
+        runs = sorted({name.split(".log", 1)[0] for name in names})
+
+        for run in runs[:max(0, len(runs) - self.keep + 1)]:
+            for name in names:
+                if name.startswith(f"{run}.log"):
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+
+    def emit(self, record):
+        if getattr(record, "run_id", None) is None:
+            return
+        try:
+            self.get_handler(record).emit(record)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        for handler in self.handlers.values():
+            handler.close()
+        self.handlers.clear()
+        super().close()
+
+
+def get_log_handlers():
+    """Creates handlers writing the records taken from the queue."""
+
+    stream_handler = logging.StreamHandler()
+    if config.LOG_FORMAT == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    handlers = [stream_handler]
+
+    if config.LOG_DIR:
+        file_handler = RunFileHandler(config.LOG_DIR, config.LOG_FILE_MAX_BYTES, config.LOG_FILE_BACKUPS,
+                                      config.LOG_RUN_FILES_KEEP)
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    return handlers
+
+
+def start_log_listener():
+    """Starts the thread writing queued records, once per process."""
+
+    global log_listener
+
+    with log_listener_lock:
+        if log_listener is None:
+            log_listener = logging.handlers.QueueListener(log_queue, *get_log_handlers(), respect_handler_level=True)
+            log_listener.start()
+            atexit.register(stop_log_listener)
+
+
+def stop_log_listener():
+    """Writes the remaining queued records and stops the listener thread."""
+
+    global log_listener
+
+    with log_listener_lock:
+        if log_listener is not None:
+            log_listener.stop()
+            for handler in log_listener.handlers:
+                handler.close()
+            log_listener = None
 
 
 class Logger:
-    """Logger class for tiny CI/CD pipelines."""
+    """Logger class for tiny CI/CD pipelines.
+
+    Records are put on a queue and written by a listener thread, so logging never waits for I/O.
+    """
+
     def __init__(self, name):
         self.logger = logging.getLogger(name)
         self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+        self.throttled = {}
+        self.throttled_lock = threading.Lock()
         # Check if handlers already exist
         if not self.logger.handlers:
-            handler = logging.StreamHandler()
-            formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-            handler.setFormatter(formatter)
+            handler = logging.handlers.QueueHandler(log_queue)
+            handler.addFilter(RunContextFilter())
             self.logger.addHandler(handler)
+        start_log_listener()
 
     def log(self, message, severity="info"):
         """Log a message with a given severity."""
@@ -25,4 +195,25 @@ class Logger:
             self.logger.error(message)
         elif severity is None:
             self.logger.info(message)
-        
+
+    def log_progress(self, key, message, severity="info"):
+        """Logs a line of a chatty progress stream at most once per interval of the stream's key.
+
+        The next logged line tells how many lines were skipped in between.
+        """
+
+        current_time = time.monotonic()
+
+        with self.throttled_lock:
+            last_time, skipped = self.throttled.get(key, (None, 0))
+            if last_time is not None and current_time - last_time < config.LOG_PROGRESS_INTERVAL:
+                self.throttled[key] = (last_time, skipped + 1)
+                return
+            self.throttled[key] = (current_time, 0)
+
+        self.log(f"{message} ({skipped} similar line(s) skipped)" if skipped else message, severity)
+
+    def end_progress(self, key):
+        """Forgets the progress stream of the key."""
+        with self.throttled_lock:
+            self.throttled.pop(key, None)
@@ -0,0 +1,188 @@
+"""Timing spans and Prometheus metrics of tiny CI/CD pipelines."""
+
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+from tiny_cicd_context import get_current_context, now
+
+# Upper bounds of the duration histogram buckets in seconds, pipeline steps take from milliseconds to an hour
+duration_buckets = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+
+def format_labels(names, values):
+    """Formats label values in the exposition format."""
+
+    if not names:
+        return ""
+
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class Counter:
+    """Monotonically increasing value per label values."""
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """Increases the value of the labels."""
+
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        """Returns lines of the metric in the exposition format."""
+
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Distribution of observed durations per label values."""
+
+    def __init__(self, name, description, labels=(), buckets=duration_buckets):
+        self.name = name
+        self.description = description
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """Records an observation of the labels."""
+
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            entry = self.values.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        """Returns lines of the metric in the exposition format."""
+
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total, observed) in sorted(self.values.items()):
+                for bound, count in zip(self.buckets, counts):
+                    labels = format_labels(self.labels + ("le",), key + (bound,))
+                    lines.append(f"{self.name}_bucket{labels} {count}")
+                lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), key + ('+Inf',))} {observed}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {round(total, 6)}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, key)} {observed}")
+        return lines
+
+
+class Gauge:
+    """Value read from a function when the metrics are scraped."""
+
+    def __init__(self, name, description, function, labels=()):
+        self.name = name
+        self.description = description
+        self.function = function
+        self.labels = tuple(labels)
+
+    def render(self):
+        """Returns lines of the metric in the exposition format.
+
+        The function returns a number, or a dictionary of numbers keyed by label values.
+        """
+
+        value = self.function()
+        values = value if isinstance(value, dict) else {(): value}
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        for key, number in sorted(values.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{format_labels(self.labels, key)} {number}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics exported on the /metrics endpoint."""
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        """Adds the metric to the export, returns it."""
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+
+        lines = []
+        for metric in self.metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.register(Histogram(
+    "tiny_cicd_stage_duration_seconds", "Duration of the pipeline stages.", ("kind", "stage")))
+run_seconds = registry.register(Histogram(
+    "tiny_cicd_run_duration_seconds", "Duration of the pipeline runs by their final status.", ("kind", "status")))
+step_seconds = registry.register(Histogram(
+    "tiny_cicd_step_duration_seconds", "Duration of the steps within the stages.", ("step", "outcome")))
+cache_requests = registry.register(Counter(
+    "tiny_cicd_cache_requests_total", "Lookups of the pipeline caches.", ("cache", "result")))
+docker_api_calls = registry.register(Counter(
+    "tiny_cicd_docker_api_calls_total", "Calls of the Docker API made by the pipelines."))
+
+
+@contextmanager
+def span(step):
+    """Measures a step, records it in the current run and in the step histogram.
+
+    Yields the span record, its outcome can be set for steps reporting failures without raising.
+    """
+
+    record = {"step": step, "started_at": now(), "seconds": None, "outcome": "success"}
+    started = time.monotonic()
+
+    try:
+        yield record
+    except BaseException:
+        record["outcome"] = "error"
+        raise
+    finally:
+        seconds = time.monotonic() - started
+        record["seconds"] = round(seconds, 3)
+        step_seconds.observe(seconds, step=step, outcome=record["outcome"])
+
+        context = get_current_context()
+        if context is not None:
+            context.spans.append(record)
+
+
+def timed(step):
+    """Decorator measuring every call of the function as a step, a False result counts as failed."""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(step) as record:
+                result = function(*args, **kwargs)
+                if result is False:
+                    record["outcome"] = "error"
+                return result
+        return wrapper
+
+    return decorator
@@ -0,0 +1,142 @@
+"""Local reverse proxy switching traffic between blue/green deployments of tiny CI/CD."""
+
+import socket
+import socketserver
+import threading
+import time
+
+from tiny_cicd_logger import Logger
+
+
+class ProxyServer(socketserver.ThreadingTCPServer):
+    """TCP server handing every accepted connection to the proxy."""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, proxy):
+        self.proxy = proxy
+        super().__init__(address, ProxyConnection)
+
+
+class ProxyConnection(socketserver.BaseRequestHandler):
+    """Connection of a client forwarded to the current target."""
+
+    def handle(self):
+        self.server.proxy.forward(self.request)
+
+
+class DeploymentProxy:
+    """Forwards connections from the public port to the port of the container currently serving it.
+
+    Switching the target only affects new connections, connections to the previous target are
+    counted so it can be stopped once they are done.
+    """
+
+    logger = Logger("DeploymentProxy")
+
+    def __init__(self, port, target_host="127.0.0.1"):
+        self.port = port
+        self.target_host = target_host
+        self.target_port = None
+        self.connections = {}
+        self.server = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Starts listening on the public port."""
+
+        with self.lock:
+            if self.server is not None:
+                return
+            self.server = ProxyServer(("0.0.0.0", self.port), self)
+
+        threading.Thread(target=self.server.serve_forever, name="tiny-cicd-proxy", daemon=True).start()
+
+        self.logger.log(f"Proxy listening on port {self.port}", "info")
+
+    def stop(self):
+        """Stops listening on the public port."""
+
+        with self.lock:
+            server = self.server
+            self.server = None
+
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+    def switch(self, target_port):
+        """Sends new connections to the target port, atomically."""
+
+        self.start()
+
+        with self.lock:
+            previous_port = self.target_port
+            self.target_port = target_port
+
+        self.logger.log(f"Proxy on port {self.port} switched from {previous_port} to {target_port}", "info")
+
+        return previous_port
+
+    def get_connection_count(self, target_port):
+        """Returns amount of open connections forwarded to the target port."""
+
+        with self.lock:
+            return self.connections.get(target_port, 0)
+
+    def wait_for_connections(self, target_port, timeout):
+        """Waits until connections to the target port are closed, returns False if some remain."""
+
+        deadline = time.time() + timeout
+
+        while self.get_connection_count(target_port) > 0:
+            if time.time() >= deadline:
+                return False
+            time.sleep(0.5)
+
+        return True
+
+    def forward(self, client):
+        """Pipes data between the client and the current target until either side closes."""
+
+        with self.lock:
+            target_port = self.target_port
+            if target_port is not None:
+                self.connections[target_port] = self.connections.get(target_port, 0) + 1
+
+        if target_port is None:
+            client.close()
+            return
+
+        try:
+            with socket.create_connection((self.target_host, target_port), timeout=10) as target:
+                target.settimeout(None)
+                upstream = threading.Thread(target=self.pipe, args=(client, target), daemon=True)
+                upstream.start()
+                self.pipe(target, client)
+                upstream.join()
+        except OSError as e:
+            self.logger.log(f"Failed to forward connection to port {target_port}: {e}", "error")
+        finally:
+            client.close()
+            with self.lock:
+                self.connections[target_port] -= 1
+
+    @staticmethod
+    def pipe(source, destination):
+        """Copies data from one socket to the other, closing the writing side at the end."""
+
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                destination.sendall(data)
+        except OSError:
+            pass
+        finally:
+            try:
+                destination.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
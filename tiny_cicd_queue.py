@@ -0,0 +1,308 @@
+"""Persistent job queue for tiny CI/CD pipelines."""
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from tiny_cicd_logger import Logger
+from tiny_cicd_context import PipelineCancelled
+
+
+def now():
+    """Returns current UTC time in ISO format."""
+    return datetime.now(timezone.utc).isoformat()
+
+
+class Job:
+    """Pipeline job waiting in or taken from the queue."""
+
+    def __init__(self, kind, params, job_id=None, status="QUEUED", created_at=None, coalesce_key=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.coalesce_key = coalesce_key
+        self.superseded_by = None
+        self.status = status
+        self.created_at = created_at or now()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+
+    def to_dict(self):
+        """Converts job to a dictionary."""
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "coalesce_key": self.coalesce_key,
+            "superseded_by": self.superseded_by,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error
+        }
+
+    def to_json(self):
+        """Converts job to JSON format."""
+        return json.dumps(self.to_dict())
+
+    @classmethod
+    def from_dict(cls, data):
+        """Creates job from a dictionary."""
+        return cls(data["kind"], data["params"], data["id"], "QUEUED", data["created_at"], data.get("coalesce_key"))
+
+
+class JobQueue:
+    """FIFO queue of pipeline jobs drained by a pool of worker threads.
+
+    Queued and running jobs are written to a state file on every change, so jobs
+    interrupted by a restart are queued again on the next start.
+
+    Jobs enqueued with a coalesce key replace a queued job with the same key and
+    cancel a running one, so only the newest job for the key gets to finish.
+    """
+
+    logger = Logger("JobQueue")
+
+    def __init__(self, state_file, workers=1, history_size=100):
+        self.state_file = state_file
+        self.workers = workers
+        self.pending = deque()
+        self.active = {}
+        self.finished = deque(maxlen=history_size)
+        self.handlers = {}
+        self.cancel_handlers = {}
+        self.merge_handlers = {}
+        self.condition = threading.Condition()
+        self.threads = []
+        self.running = False
+        # Cancelling a run may wait for Docker, the webhook enqueueing its replacement must not
+        self.cancel_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="tiny-cicd-cancel")
+        self.load()
+
+    def register_handler(self, kind, handler, cancel=None, merge=None):
+        """Registers functions handling jobs of the given kind.
+
+        The handler is called with the job to run it, cancel with a running job
+        superseded by a newer one, and merge with the params of a superseded queued
+        job and of its replacement, returning params of the replacement.
+        """
+        self.handlers[kind] = handler
+        if cancel is not None:
+            self.cancel_handlers[kind] = cancel
+        if merge is not None:
+            self.merge_handlers[kind] = merge
+
+    def enqueue(self, kind, params, coalesce_key=None):
+        """Adds a job to the queue and returns it."""
+
+        job = Job(kind, params, coalesce_key=coalesce_key)
+        superseded_running = []
+
+        with self.condition:
+            if coalesce_key is None:
+                self.pending.append(job)
+            else:
+                superseded_running = [running_job for running_job in self.active.values()
+                                      if running_job.coalesce_key == coalesce_key]
+                # Cancelled runs are replaced by the new job, which has to cover their changes too
+                merge = self.merge_handlers.get(kind)
+                if merge is not None:
+                    for running_job in superseded_running:
+                        if running_job.kind == kind:
+                            job.params = merge(running_job.params, job.params)
+                self.coalesce(job)
+            self.persist()
+            self.condition.notify()
+
+        self.logger.log(f"Queued {kind} job {job.id}")
+
+        for running_job in superseded_running:
+            self.cancel(running_job, job)
+
+        return job
+
+    def coalesce(self, job):
+        """Puts the job in place of a queued job with the same coalesce key."""
+
+        for index, queued_job in enumerate(self.pending):
+            if queued_job.kind == job.kind and queued_job.coalesce_key == job.coalesce_key:
+                merge = self.merge_handlers.get(job.kind)
+                if merge is not None:
+                    job.params = merge(queued_job.params, job.params)
+
+                queued_job.status = "SUPERSEDED"
+                queued_job.superseded_by = job.id
+                queued_job.finished_at = now()
+                self.finished.append(queued_job)
+                self.pending[index] = job
+
+                self.logger.log(f"Job {queued_job.id} superseded by {job.id}")
+                return
+
+        self.pending.append(job)
+
+    def cancel(self, job, newer_job):
+        """Cancels a running job superseded by a newer job in the background."""
+
+        job.superseded_by = newer_job.id
+        cancel = self.cancel_handlers.get(job.kind)
+
+        if cancel is None:
+            return
+
+        self.logger.log(f"Cancelling job {job.id} superseded by {newer_job.id}")
+
+        self.cancel_executor.submit(self.run_cancel_handler, cancel, job)
+
+    def run_cancel_handler(self, cancel, job):
+        """Calls the cancel handler of the job, logging its failure."""
+
+        try:
+            cancel(job)
+        except Exception as e:
+            self.logger.log(f"Failed to cancel job {job.id}: {e}", "error")
+
+    def get_job(self, job_id):
+        """Returns job with given id or None."""
+
+        with self.condition:
+            for job in list(self.pending) + list(self.active.values()) + list(self.finished):
+                if job.id == job_id:
+                    return job
+        return None
+
+    def get_jobs(self):
+        """Returns all known jobs, newest last."""
+
+        with self.condition:
+            return list(self.finished) + list(self.active.values()) + list(self.pending)
+
+    def depth(self):
+        """Returns the amount of jobs waiting in the queue."""
+
+        with self.condition:
+            return len(self.pending)
+
+    def start(self):
+        """Starts worker threads."""
+
+        if self.running:
+            return
+
+        self.running = True
+
+        for number in range(self.workers):
+            thread = threading.Thread(target=self.worker_loop, name=f"tiny-cicd-worker-{number}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+        self.logger.log(f"Started {self.workers} worker(s), {len(self.pending)} job(s) queued")
+
+    def stop(self, timeout=None):
+        """Stops worker threads once they finish their current job, waiting up to the timeout in total.
+
+        Returns amount of jobs still running, they are kept in the state file and run again after restart.
+        """
+
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+
+        deadline = None if timeout is None else time.time() + timeout
+
+        for thread in self.threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.time()))
+
+        self.threads = [thread for thread in self.threads if thread.is_alive()]
+
+        with self.condition:
+            return len(self.active)
+
+    def worker_loop(self):
+        """Takes jobs from the queue and runs their handlers."""
+
+        while True:
+            with self.condition:
+                while self.running and not self.pending:
+                    self.condition.wait()
+
+                if not self.running:
+                    return
+
+                job = self.pending.popleft()
+                job.status = "RUNNING"
+                job.started_at = now()
+                self.active[job.id] = job
+                self.persist()
+
+            self.run_job(job)
+
+            with self.condition:
+                job.finished_at = now()
+                del self.active[job.id]
+                self.finished.append(job)
+                self.persist()
+
+    def run_job(self, job):
+        """Runs handler registered for the job kind."""
+
+        handler = self.handlers.get(job.kind)
+
+        if handler is None:
+            self.logger.log(f"No handler registered for {job.kind} job {job.id}", "error")
+            job.status = "FAILED"
+            job.error = f"Unknown job kind: {job.kind}"
+            return
+
+        self.logger.log(f"Running {job.kind} job {job.id}")
+
+        try:
+            handler(job)
+            job.status = "SUCCEEDED"
+        except PipelineCancelled as e:
+            self.logger.log(f"Job {job.id} cancelled: {e}")
+            job.status = "CANCELLED"
+        except Exception as e:
+            self.logger.log(f"Job {job.id} failed: {e}", "error")
+            job.status = "FAILED"
+            job.error = str(e)
+
+    def persist(self):
+        """Writes queued and running jobs to the state file."""
+
+        jobs = [job.to_dict() for job in list(self.active.values()) + list(self.pending)]
+
+        try:
+            os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+            temporary_file = f"{self.state_file}.tmp"
+            with open(temporary_file, 'w', encoding="UTF-8") as file:
+                json.dump(jobs, file)
+            os.replace(temporary_file, self.state_file)
+        except OSError as e:
+            self.logger.log(f"Failed to persist job queue: {e}", "error")
+
+    def load(self):
+        """Restores jobs left in the state file by a previous run."""
+
+        if not os.path.exists(self.state_file):
+            return
+
+        try:
+            with open(self.state_file, 'r', encoding="UTF-8") as file:
+                jobs = json.load(file)
+        except (OSError, ValueError) as e:
+            self.logger.log(f"Failed to load job queue: {e}", "error")
+            return
+
+        for data in jobs:
+            self.pending.append(Job.from_dict(data))
+
+        if self.pending:
+            self.logger.log(f"Restored {len(self.pending)} job(s) from {self.state_file}")
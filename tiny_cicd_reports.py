@@ -0,0 +1,177 @@
+"""Test report parsing and test duration history for tiny CI/CD pipelines."""
+
+import json
+import os
+import re
+import threading
+import xml.etree.ElementTree as ElementTree
+
+from tiny_cicd_logger import Logger
+
+go_test_result = re.compile(r"^\s*--- (PASS|FAIL|SKIP): (\S+) \((\d+(?:\.\d+)?)s\)$")
+go_package_result = re.compile(r"^(ok|FAIL)\s+(\S+)\s")
+
+
+def test_result(name, suite, seconds, outcome):
+    """Creates a dictionary describing a single test result."""
+    return {"name": name, "suite": suite, "seconds": seconds, "outcome": outcome}
+
+
+def parse_junit_xml(content):
+    """Parses JUnit XML report written by pytest, surefire and similar runners."""
+
+    results = []
+    root = ElementTree.fromstring(content)
+
+    for testcase in root.iter("testcase"):
+        if testcase.find("failure") is not None or testcase.find("error") is not None:
+            outcome = "failed"
+        elif testcase.find("skipped") is not None:
+            outcome = "skipped"
+        else:
+            outcome = "passed"
+
+        results.append(test_result(testcase.get("name", ""), testcase.get("classname", ""),
+                                   float(testcase.get("time") or 0), outcome))
+
+    return results
+
+
+def parse_trx(content):
+    """Parses Visual Studio TRX report written by dotnet test."""
+
+    results = []
+    root = ElementTree.fromstring(content)
+    namespace = {"trx": "http://microsoft.com/schemas/VisualStudio/TeamTest/2010"}
+
+    test_classes = {}
+    for unit_test in root.iterfind(".//trx:UnitTest", namespace):
+        method = unit_test.find("trx:TestMethod", namespace)
+        if method is not None:
+            test_classes[unit_test.get("id")] = method.get("className", "")
+
+    for unit_test_result in root.iterfind(".//trx:UnitTestResult", namespace):
+        outcome = unit_test_result.get("outcome", "")
+        if outcome == "Passed":
+            outcome = "passed"
+        elif outcome == "NotExecuted":
+            outcome = "skipped"
+        else:
+            outcome = "failed"
+
+        results.append(test_result(unit_test_result.get("testName", ""),
+                                   test_classes.get(unit_test_result.get("testId"), ""),
+                                   parse_trx_duration(unit_test_result.get("duration", "")), outcome))
+
+    return results
+
+
+def parse_trx_duration(duration):
+    """Converts TRX duration in hh:mm:ss.fffffff format to seconds."""
+
+    try:
+        hours, minutes, seconds = duration.split(":")
+        return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    except ValueError:
+        return 0.0
+
+
+def parse_go_test_output(lines):
+    """Parses verbose go test output, attributing tests to the package reported after them."""
+
+    results = []
+    package_results = []
+
+    for line in lines:
+        match = go_test_result.match(line)
+        if match:
+            outcome = {"PASS": "passed", "FAIL": "failed", "SKIP": "skipped"}[match.group(1)]
+            package_results.append(test_result(match.group(2), "", float(match.group(3)), outcome))
+            continue
+
+        match = go_package_result.match(line)
+        if match:
+            for result in package_results:
+                result["suite"] = match.group(2)
+            results += package_results
+            package_results = []
+
+    return results + package_results
+
+
+def parse_report(name, content):
+    """Parses report file by its extension, returns None for unknown files."""
+
+    try:
+        if name.endswith(".trx"):
+            return parse_trx(content)
+        if name.endswith(".xml"):
+            return parse_junit_xml(content)
+    except ElementTree.ParseError:
+        return None
+
+    return None
+
+
+def summarize(results):
+    """Counts test results by outcome and sums their durations."""
+
+    summary = {"total": len(results), "passed": 0, "failed": 0, "skipped": 0, "seconds": 0.0}
+
+    for result in results:
+        summary[result["outcome"]] += 1
+        summary["seconds"] += result["seconds"]
+
+    summary["seconds"] = round(summary["seconds"], 3)
+
+    return summary
+
+
+class TestDurationHistory:
+    """Durations of the tests of each repository from their most recent runs, kept on disk."""
+
+    logger = Logger("TestDurationHistory")
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+
+    def get_path(self, repo_name):
+        """Returns path of the file keeping durations of the repository's tests."""
+        return os.path.join(self.directory, f"{repo_name}.json")
+
+    def load(self, repo_name):
+        """Returns durations of the repository's tests keyed by suite and test name."""
+
+        path = self.get_path(repo_name)
+
+        if not os.path.exists(path):
+            return {}
+
+        with self.lock:
+            try:
+                with open(path, 'r', encoding="UTF-8") as file:
+                    return json.load(file)
+            except (OSError, ValueError) as e:
+                self.logger.log(f"Failed to load test durations of {repo_name}: {e}", "error")
+                return {}
+
+    def record(self, repo_name, results):
+        """Stores durations of the test results, keeping durations of tests that did not run."""
+
+        durations = self.load(repo_name)
+
+        for result in results:
+            if result["outcome"] != "skipped":
+                durations[f"{result['suite']}::{result['name']}"] = result["seconds"]
+
+        path = self.get_path(repo_name)
+
+        with self.lock:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(f"{path}.tmp", 'w', encoding="UTF-8") as file:
+                    json.dump(durations, file)
+                os.replace(f"{path}.tmp", path)
+            except OSError as e:
+                self.logger.log(f"Failed to store test durations of {repo_name}: {e}", "error")
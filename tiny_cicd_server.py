@@ -0,0 +1,62 @@
+"""Production server for the tiny CI/CD pipeline, serving requests and websockets with gevent."""
+
+from gevent import monkey
+
+# Sockets, threads and subprocesses have to be patched before anything else imports them
+monkey.patch_all()
+
+import signal
+
+import gevent
+from gevent.event import Event
+from gevent.pywsgi import WSGIServer
+
+from tiny_cicd import app, job_queue, logger, service
+from tiny_cicd_logger import stop_log_listener
+from tiny_cicd_service import deployment_proxy
+import tiny_cicd_config as config
+
+
+def serve():
+    """Serves the pipeline until SIGTERM or SIGINT, then lets running pipelines finish."""
+
+    server = WSGIServer((config.SERVER_HOST, config.SERVER_PORT), app)
+    stopping = Event()
+
+    gevent.signal_handler(signal.SIGTERM, stopping.set)
+    gevent.signal_handler(signal.SIGINT, stopping.set)
+
+    service.restore_deployments()
+    job_queue.start()
+    server.start()
+
+    logger.log(f"Serving on {config.SERVER_HOST}:{config.SERVER_PORT}")
+
+    stopping.wait()
+
+    # Webhooks keep being accepted while draining, their jobs wait in the state file for the next start
+    logger.log(f"Shutting down, waiting up to {config.SHUTDOWN_TIMEOUT}s for running pipelines")
+
+    unfinished = job_queue.stop(config.SHUTDOWN_TIMEOUT)
+
+    if unfinished:
+        logger.log(f"{unfinished} pipeline(s) did not finish in time, they run again after restart", "error")
+
+    server.stop(timeout=5)
+
+    service.prepull_executor.shutdown(wait=False, cancel_futures=True)
+
+    # Mirroring to Docker Hub is not needed for deployments, unfinished pushes are dropped
+    service.mirror_executor.shutdown(wait=False, cancel_futures=True)
+
+    deployment_proxy.stop()
+
+    service.run_store.stop(30)
+
+    stop_log_listener()
+
+    logger.log("Stopped")
+
+
+if __name__ == '__main__':
+    serve()
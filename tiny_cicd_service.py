@@ -1,19 +1,90 @@
 """Service part for the tiny CI/CD system"""
 
 import subprocess
-import shutil
+import hashlib
+import io
 import json
 import os
+import re
+import tarfile
+import socket
+import threading
+import time
+import http.client
+import urllib.parse
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import git
 import docker
 
 
 from tiny_cicd_logger import Logger
+from tiny_cicd_context import PipelineContext, get_current_context, run_scope
+from tiny_cicd_worktrees import WorktreePool
+import tiny_cicd_reports as reports
+import tiny_cicd_test_units as test_units
+from tiny_cicd_cache import ResultCache, get_cache_key
+from tiny_cicd_events import EventBus
+from tiny_cicd_store import RunStore
+from tiny_cicd_proxy import DeploymentProxy
+from tiny_cicd_detectors import ProjectDetectionService, select_affected_projects
+import tiny_cicd_metrics as metrics
+from tiny_cicd_metrics import timed
+import tiny_cicd_config as config
 
 deployments_dir = "deployments"
 dockerhub_repo_name = "kapiaszczyk"
 pipeline_dir = os.getcwd()
 deployment_params = {"port: 8080"}
+run_history_size = config.JOB_HISTORY_SIZE
+docker_client = None
+docker_client_lock = threading.Lock()
+test_duration_history = reports.TestDurationHistory(os.path.join(pipeline_dir, config.TEST_DURATIONS_DIR))
+result_cache = ResultCache(os.path.join(pipeline_dir, config.RESULT_CACHE_FILE), config.RESULT_CACHE_SIZE)
+worktree_pool = WorktreePool(os.path.join(pipeline_dir, config.GIT_WORKTREE_DIR), config.GIT_WORKTREE_POOL_SIZE)
+project_detection = ProjectDetectionService(config.PROJECT_DETECTION_DEPTH)
+run_store = RunStore(os.path.join(pipeline_dir, config.RUN_STORE_FILE))
+deployment_proxy = DeploymentProxy(config.DEPLOY_PORT, config.DEPLOY_HOST)
+
+def get_docker_client():
+    """Returns the Docker client shared by all services and workers.
+
+    The client keeps a pool of HTTP connections to the daemon and counts the API calls
+    made on behalf of each run.
+    """
+
+    global docker_client
+
+    with docker_client_lock:
+        if docker_client is None:
+            docker_client = docker.from_env(max_pool_size=config.DOCKER_POOL_SIZE)
+            docker_client.api.hooks["response"].append(count_docker_api_call)
+            docker_client.api.hooks["response"].append(keep_build_response)
+        return docker_client
+
+
+# Response of the Docker API build started by the current thread, kept so the build can be aborted
+build_responses = threading.local()
+
+
+def keep_build_response(response, *args, **kwargs):
+    """Remembers the streamed response of a Docker API build for the thread that started it."""
+
+    if response.request.method == "POST" and urllib.parse.urlsplit(response.request.url).path.endswith("/build"):
+        build_responses.response = response
+
+
+def count_docker_api_call(response, *args, **kwargs):
+    """Counts a Docker API call towards the run handled by the current thread."""
+
+    context = get_current_context()
+
+    if context is not None:
+        context.docker_api_calls += 1
+
+    metrics.docker_api_calls.inc()
+
 
 class TinyCICDService:
     """Tiny CI/CD service class."""
@@ -21,188 +92,755 @@ class TinyCICDService:
     logger = Logger("TinyCICDService")
 
     def __init__(self):
-        self.status = "IDLE"
-        self.repo_name = ""
-        self.repo_directory = ""
-        self.repo_url = ""
-        self.project_type = ""
         self.pipeline_dir = pipeline_dir
         self.deployment_dir = deployments_dir
-        self.last_tag_number = None
-        self.deployed_container_id = None
+        self.runs = OrderedDict()
+        self.last_runs = {}
+        self.run_store = run_store
+        self.last_tag_numbers = run_store.get_latest("ci", "image_tag")
+        self.deployed_container_ids = run_store.get_latest("cd", "deployed_container_id")
+        self.deployment_ports = {}
+        self.proxied_image = None
+        self.repo_locks = {}
+        self.cancelled_run_ids = set()
+        self.runs_since_full_test = {}
+        self.lock = threading.Lock()
+        self.event_bus = EventBus(config.STATUS_SUBSCRIPTION_SIZE)
         self.docker_service = DockerService()
+        self.prepulls = {}
+        self.release_listeners = []
+        self.mirror_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tiny-cicd-mirror")
+        self.prepull_executor = ThreadPoolExecutor(max_workers=config.DEPLOY_PREPULL_CONCURRENCY,
+                                                   thread_name_prefix="tiny-cicd-prepull")
 
-    def to_json(self):
+    def to_json(self, repo_name=None):
         """Converts pipeline details to JSON format."""
         data = {
-            "status": self.status,
-            "repo_name": self.repo_name,
-            "repo_directory": self.repo_directory,
-            "repo_url": self.repo_url,
-            "project_type": self.project_type,
+            "status": self.get_overall_status(),
             "pipeline_dir": self.pipeline_dir,
-            "deployments": self.deployment_dir
+            "deployments": self.deployment_dir,
+            "repositories": {}
         }
+
+        with self.lock:
+            contexts = [(name, self.runs.get(run_id)) for name, run_id in self.last_runs.items()]
+
+        for name, context in contexts:
+            if context is not None and (repo_name is None or name == repo_name):
+                data["repositories"][name] = context.to_dict()
+
         return json.dumps(data)
 
-    def get_last_deployment_details(self):
+    def get_last_deployment_details(self, repo_name=None):
         """Get the last deployment details."""
 
-        data = {
-            "last_tag_number": self.last_tag_number,
-            "deployed_container_id": self.deployed_container_id
-        }
+        data = {}
+
+        with self.lock:
+            last_tag_numbers = dict(self.last_tag_numbers)
+            deployed_container_ids = dict(self.deployed_container_ids)
+
+        for name in set(last_tag_numbers) | set(deployed_container_ids):
+            if repo_name is None or name == repo_name:
+                data[name] = {
+                    "last_tag_number": last_tag_numbers.get(name),
+                    "deployed_container_id": deployed_container_ids.get(name)
+                }
 
         return json.dumps(data)
 
+    def get_overall_status(self):
+        """Returns IDLE when no pipeline is running, BUSY otherwise."""
+        with self.lock:
+            active = any(context.is_active() for context in self.runs.values())
+        return "BUSY" if active else "IDLE"
 
-    def get_status(self):
+    def get_status(self, repo_name=None):
         """Get CI/CD pipeline status."""
-        return self.status
 
-    def get_pipeline_details(self):
+        with self.lock:
+            runs = list(self.runs.values())
+
+        data = {
+            "status": "BUSY" if any(context.is_active() for context in runs) else "IDLE",
+            "repositories": {},
+            "active_runs": {}
+        }
+
+        for context in runs:
+            if repo_name is not None and context.repo_name != repo_name:
+                continue
+            data["repositories"][context.repo_name] = context.status
+            if context.is_active():
+                data["active_runs"][context.run_id] = {"key": context.key, "status": context.status}
+
+        return json.dumps(data)
+
+    def get_pipeline_details(self, repo_name=None):
         """Get CI/CD pipeline details."""
-        return self.to_json()
+        return self.to_json(repo_name)
+
+    def get_run(self, run_id):
+        """Returns context of the run with given id or None."""
+        return self.runs.get(run_id)
+
+    def get_run_details(self, run_id):
+        """Returns details of the run with given id, looking up older runs in the run store, or None."""
+
+        context = self.get_run(run_id)
+
+        if context is not None:
+            return context.to_dict()
+
+        return self.run_store.get_run(run_id)
+
+    def get_run_history(self, repo_name=None, commit=None, kind=None, limit=20, offset=0):
+        """Returns a page of stored runs, newest first, in JSON format."""
+
+        runs, total = self.run_store.get_runs(repo_name, commit, kind, limit, offset)
+
+        return json.dumps({"runs": runs, "total": total, "limit": limit, "offset": offset})
+
+    def get_active_runs(self):
+        """Returns contexts of the runs that have not finished yet."""
+        with self.lock:
+            return [context for context in self.runs.values() if context.is_active()]
+
+    def register_run(self, context):
+        """Keeps track of a new run, forgetting the oldest finished ones."""
+
+        context.listeners.append(self.publish_run_event)
+        context.listeners.append(self.store_run)
+        context.listeners.append(self.record_run_metrics)
+
+        with self.lock:
+            self.runs[context.run_id] = context
+            self.last_runs[context.repo_name] = context.run_id
+
+            if context.run_id in self.cancelled_run_ids:
+                self.cancelled_run_ids.discard(context.run_id)
+                context.cancel()
+
+            for old_run_id in list(self.runs):
+                if len(self.runs) <= run_history_size:
+                    break
+                if not self.runs[old_run_id].is_active() and old_run_id not in self.last_runs.values():
+                    del self.runs[old_run_id]
+                    self.event_bus.forget(f"status:{old_run_id}")
+
+        self.publish_run_event(context, "status")
+        self.store_run(context, "status")
+
+    def store_run(self, context, event_type, payload=None):
+        """Records the run in the run store on every stage transition."""
+
+        if event_type == "status":
+            self.run_store.save(context)
+
+    @staticmethod
+    def record_run_metrics(context, event_type, payload=None):
+        """Exports durations of the finished stages and runs."""
+
+        if event_type == "stage":
+            metrics.stage_seconds.observe(payload["seconds"], kind=context.kind, stage=payload["stage"])
+        elif event_type == "status" and not context.is_active():
+            metrics.run_seconds.observe(context.seconds, kind=context.kind, status=context.status)
+
+    def publish_run_event(self, context, event_type, payload=None):
+        """Publishes a stage transition or an output line of the run to the status clients."""
+
+        if event_type == "status":
+            self.event_bus.publish("status", {
+                "run_id": context.run_id,
+                "kind": context.kind,
+                "key": context.key,
+                "repo_name": context.repo_name,
+                "status": context.status,
+                "error": context.error
+            }, f"status:{context.run_id}")
+        elif event_type == "output":
+            self.event_bus.publish("output", {
+                "run_id": context.run_id,
+                "repo_name": context.repo_name,
+                "line": payload
+            })
+
+    def cancel_run(self, run_id):
+        """Cancels a run, or remembers to cancel it if it has not started yet."""
+
+        with self.lock:
+            context = self.runs.get(run_id)
+            if context is None:
+                self.cancelled_run_ids.add(run_id)
+                return
+
+        self.logger.log(f"Cancelling run {run_id} for {context.key}")
+        context.cancel()
+
+    def get_repo_lock(self, repo_name):
+        """Returns lock serializing runs of the same repository."""
 
-    def trigger_pipeline(self, url, repo_name):
+        with self.lock:
+            if repo_name not in self.repo_locks:
+                self.repo_locks[repo_name] = threading.Lock()
+            return self.repo_locks[repo_name]
+
+    def trigger_pipeline(self, url, repo_name, commit=None, before=None, run_id=None):
         """Trigger the CI/CD pipeline."""
 
-        self.status = "TRIGGERED"
+        context = PipelineContext("ci", repo_name, url, commit, before, run_id)
+        context.repo_directory = os.path.join(self.pipeline_dir, self.deployment_dir, repo_name)
+        self.register_run(context)
 
-        self.repo_name = repo_name
-        self.repo_url = url
-        self.repo_directory = os.path.join(self.deployment_dir, repo_name)
+        # Runs in worktrees of their own only need to be serialized per commit
+        lock_key = context.key if config.GIT_FETCH_MODE == "mirror" else repo_name
 
-        self.logger.log(f"Triggering pipeline for {repo_name}")
+        with self.get_repo_lock(lock_key), run_scope(context):
+            self.logger.log(f"Triggering pipeline for {context.key}")
 
-        self.status = "PULLING CODE"
+            try:
+                context.check_cancelled()
 
-        self.pull_code()
+                context.set_status("PULLING CODE")
 
-        self.status = "RUNNING TESTS"
+                self.pull_code(context)
 
-        self.test_code()
+                context.check_cancelled()
 
-        self.status = "BUILDING IMAGE"
+                if context.project_type == "UNSUPPORTED" and context.projects:
+                    self.run_subproject_pipelines(context)
+                else:
+                    self.run_build_stages(context)
+            except Exception as e:
+                context.finish(str(e))
+                raise
+            else:
+                context.finish()
+            finally:
+                self.remove_test_image(context)
+                self.release_code(context)
+                self.prune_build_cache()
 
-        self.build_image()
+        return context
 
-        self.status = "PUSHING IMAGE"
+    def run_build_stages(self, context):
+        """Tests, builds and pushes the image of the run's project, reusing a cached result if possible."""
 
-        self.push_image()
+        if not self.reuse_cached_result(context):
+            context.set_status("RUNNING TESTS")
 
-        self.status = "IDLE"
+            self.test_code(context)
 
-    def trigger_deployment_pipeline(self, image_tag):
-        """Triggers the deployment pipeline"""
+            context.check_cancelled()
+
+            context.set_status("BUILDING IMAGE")
+
+            self.build_image(context)
+
+            self.store_result(context)
+
+        context.check_cancelled()
+
+        if config.REGISTRY_MODE != "none":
+            context.set_status("PUSHING IMAGE")
+
+        self.push_image(context)
+
+        # Only released images count as the latest, a failed push fails the run instead
+        self.last_tag_numbers[context.repo_name] = context.image_tag
+
+        self.logger.log(f"Latest image tag is: {context.image_tag}")
+
+    def run_subproject_pipelines(self, context):
+        """Runs pipelines of the monorepo's subprojects with changed files concurrently.
+
+        Each subproject gets a run of its own with its own image tag, the run fails if any of them fails.
+        """
+
+        git_service = GitService(context.repo_url, context.repo_directory, context.repo_name)
+        context.changed_files = git_service.get_changed_files(context.before, context.commit)
+        projects = select_affected_projects(context.projects, context.changed_files)
+
+        self.logger.log(f"Subprojects of {context.key} affected by the changes: "
+                        f"{[project['path'] for project in projects]}")
+
+        if not projects:
+            return
+
+        subproject_contexts = [self.create_subproject_run(context, project) for project in projects]
+
+        context.set_status("RUNNING SUBPROJECT PIPELINES")
+
+        def run_subproject(subproject_context):
+            with run_scope(subproject_context):
+                try:
+                    subproject_context.check_cancelled()
+                    self.run_build_stages(subproject_context)
+                except Exception as e:
+                    self.logger.log(f"Pipeline of {subproject_context.key} failed: {e}", "error")
+                    subproject_context.finish(str(e))
+                    return False
+                finally:
+                    self.remove_test_image(subproject_context)
+
+                subproject_context.finish()
+                return True
+
+        def cancel_subprojects():
+            for subproject_context in subproject_contexts:
+                subproject_context.cancel()
+
+        with context.cancellable(cancel_subprojects):
+            with ThreadPoolExecutor(max_workers=min(len(subproject_contexts), config.MONOREPO_CONCURRENCY)) as executor:
+                succeeded = list(executor.map(run_subproject, subproject_contexts))
+
+        context.check_cancelled()
 
-        self.status = "DEPLOYING"
+        failed = [subproject_context.key for subproject_context, ok in zip(subproject_contexts, succeeded) if not ok]
+
+        if failed:
+            raise RuntimeError(f"Pipelines of subprojects failed: {', '.join(failed)}")
+
+    def create_subproject_run(self, context, project):
+        """Registers run of a monorepo's subproject, sharing the checkout of the monorepo run."""
+
+        name = project["path"].replace("/", "-").lower()
+
+        subproject_context = PipelineContext("ci", f"{context.repo_name}-{name}", context.repo_url, context.commit,
+                                             context.before, f"{context.run_id}-{name}")
+        subproject_context.repo_directory = os.path.join(context.repo_directory, project["path"])
+        subproject_context.project_type = project["type"]
+        subproject_context.projects = [project]
+        subproject_context.project_path = project["path"]
+        subproject_context.parent_run_id = context.run_id
+
+        if context.changed_files is not None:
+            prefix = f"{project['path']}/"
+            subproject_context.changed_files = [path[len(prefix):] if path.startswith(prefix) else path
+                                                for path in context.changed_files]
+
+        self.register_run(subproject_context)
+        context.subprojects.append(subproject_context.run_id)
+
+        return subproject_context
+
+    def trigger_deployment_pipeline(self, image_tag, run_id=None):
+        """Triggers the deployment pipeline"""
 
         image_name, tag = image_tag.split(':')
 
-        old_container_id = self.deployed_container_id
+        context = PipelineContext("cd", image_name, commit=tag, run_id=run_id)
+        context.image_tag = image_tag
+        self.register_run(context)
 
-        if old_container_id is None:
-            self.docker_service.get_youngest_container_id(image_name)
+        with self.get_repo_lock(image_name), run_scope(context):
+            context.set_status("DEPLOYING")
+
+            try:
+                old_container_id = self.deployed_container_ids.get(image_name)
+
+                if old_container_id is None:
+                    old_container_id = self.docker_service.get_youngest_container_id(image_name)
+
+                context.set_status("PULLING IMAGE")
 
-        self.status = "PULLING IMAGE"
+                self.pull_image(image_tag)
 
-        self.pull_image(image_tag)
+                if config.DEPLOY_STRATEGY == "blue-green":
+                    self.deploy_blue_green(context, old_container_id)
+                else:
+                    context.set_status("STOPPING CURRENTLY DEPLOYED CONTAINER")
 
-        self.status = "STOPPING CURRENTLY DEPLOYED CONTAINER"
+                    self.stop_deployed_container(image_name, old_container_id)
 
-        self.stop_deployed_container()
+                    context.set_status("DEPLOYING IMAGE")
 
-        self.status = "DEPLOYING IMAGE"
+                    self.deploy_image(context, f"{config.DEPLOY_CONTAINER_PORT}:{config.DEPLOY_PORT}", old_container_id)
+
+                    context.set_status("CLEANING UP CONTAINERS")
+
+                    self.remove_paused_container(old_container_id)
+
+                self.prune_images(3, (image_name))
+            except Exception as e:
+                context.finish(str(e))
+                raise
+
+            context.finish()
+
+        return context
+
+    def deploy_blue_green(self, context, old_container_id):
+        """Starts the new container next to the deployed one and switches traffic to it once it is healthy.
+
+        The deployed container keeps serving if the new one does not start, fails its health check
+        or the proxy cannot switch to it. The proxy serves one image, others are refused.
+        """
+
+        image_name = context.repo_name
+
+        with self.lock:
+            if self.proxied_image not in (None, image_name):
+                raise RuntimeError(f"Proxy on port {config.DEPLOY_PORT} already serves {self.proxied_image}, "
+                                   f"blue/green deployments serve a single image")
+            claimed = self.proxied_image is None
+            self.proxied_image = image_name
+
+        old_port = self.deployment_ports.get(image_name)
+        new_port = next(port for port in config.DEPLOY_SLOT_PORTS if port != old_port)
+        container_id = None
+        cut_over = False
+
+        try:
+            context.set_status("STARTING NEW CONTAINER")
+
+            container_id = self.docker_service.deploy_image(context.image_tag,
+                                                            f"{config.DEPLOY_CONTAINER_PORT}:{new_port}")
+
+            if container_id is None:
+                raise RuntimeError(f"Failed to start {context.image_tag}, the deployed container keeps serving")
+
+            context.set_status("CHECKING HEALTH")
+
+            if not self.docker_service.wait_until_healthy(container_id, new_port):
+                raise RuntimeError(f"{context.image_tag} failed its health check, the deployed container keeps serving")
+
+            context.set_status("SWITCHING TRAFFIC")
+
+            # A container deployed by the recreate strategy holds the public port the proxy needs,
+            # it is stopped once, right before the first switch
+            if (old_container_id is not None and old_port is None and
+                    self.docker_service.get_host_port(old_container_id, config.DEPLOY_CONTAINER_PORT)
+                    == config.DEPLOY_PORT):
+                self.logger.log(f"Stopping container {old_container_id} publishing port {config.DEPLOY_PORT} "
+                                f"to hand it over to the proxy", "warning")
+                self.docker_service.stop_running_container(old_container_id)
+                cut_over = True
+
+            deployment_proxy.switch(new_port)
+        except Exception:
+            if container_id is not None:
+                self.docker_service.stop_running_container(container_id)
+                self.docker_service.remove_container(container_id)
+            if cut_over:
+                self.docker_service.run_container(old_container_id)
+            if claimed:
+                with self.lock:
+                    self.proxied_image = None
+            raise
+
+        self.deployed_container_ids[image_name] = container_id
+        self.deployment_ports[image_name] = new_port
+        context.deployed_container_id = container_id
+
+        self.logger.log(f"Deployed container id: {container_id}")
+
+        if old_container_id is None or old_container_id == container_id:
+            return
 
-        self.deploy_image(image_tag, None)
+        context.set_status("DRAINING PREVIOUS CONTAINER")
 
-        self.status = "CLEANING UP CONTAINERS"
+        if old_port is not None and not deployment_proxy.wait_for_connections(old_port, config.DEPLOY_DRAIN_TIMEOUT):
+            self.logger.log(f"Connections to container {old_container_id} still open, stopping it anyway", "warning")
+
+        if not cut_over:
+            self.docker_service.stop_running_container(old_container_id)
 
         self.remove_paused_container(old_container_id)
 
-        image_name, tag = image_tag.split(':')
+    def restore_deployments(self):
+        """Points the blue/green proxy at the deployed container again after a restart."""
 
-        self.prune_images(3, (image_name))
+        if config.DEPLOY_STRATEGY != "blue-green":
+            return
 
-        self.status = "IDLE"
+        for image_name, container_id in self.deployed_container_ids.items():
+            port = self.docker_service.get_host_port(container_id, config.DEPLOY_CONTAINER_PORT)
+            if port not in config.DEPLOY_SLOT_PORTS:
+                continue
+            if self.proxied_image is not None:
+                self.logger.log(f"Proxy already serves {self.proxied_image}, not restoring {image_name}", "error")
+                continue
+            self.proxied_image = image_name
+            self.deployment_ports[image_name] = port
+            deployment_proxy.switch(port)
 
     def trigger_shutdown(self):
         """Shuts down all containers"""
 
-        self.status = "SHUTTING DOWN"
+        self.logger.log("Shutting down")
 
         self.docker_service.stop_all_containers()
 
 
-    def pull_code(self):
+    def pull_code(self, context):
         """Pull code from GitHub."""
 
-        git_service = GitService(self.repo_url, self.repo_directory, self.repo_name)
-        git_service.resolve_code()
+        git_service = GitService(context.repo_url, context.repo_directory, context.repo_name)
+        git_service.resolve_code(context.commit)
+
+        context.repo_directory = git_service.repo_directory
+
+        context.projects = UtilService.detect_projects(context.repo_directory, context.repo_name)
+        context.project_type = UtilService.get_root_project_type(context.projects)
+
+    def release_code(self, context):
+        """Releases the checkout used by the run."""
 
-        self.project_type = UtilService().get_project_type(self.repo_directory)
+        git_service = GitService(context.repo_url, context.repo_directory, context.repo_name)
+        git_service.release_code()
 
-    def test_code(self):
+    def remove_test_image(self, context):
+        """Removes the test image kept for the release build."""
+
+        if context.test_image_tag is not None:
+            self.docker_service.remove_docker_image(context.test_image_tag)
+            context.test_image_tag = None
+
+    def prune_build_cache(self):
+        """Keeps the dependency caches of the builds within the configured size."""
+
+        if config.BUILD_CACHE_MAX_SIZE:
+            self.docker_service.prune_build_cache(config.BUILD_CACHE_MAX_SIZE)
+
+    def test_code(self, context):
         """Test code."""
 
-        self.status = "RUNNING TESTS"
-        self.logger.log("Running tests", "info")
+        self.logger.log(f"Running tests for {context.key}", "info")
 
         test_runner = TestRunnerService()
 
-        test_runner.run_tests(self.repo_name, self.project_type, self.pipeline_dir, self.repo_directory)
+        units = self.select_tests(context) if config.TEST_IMPACT else None
 
-        return None
+        exit_code = test_runner.run_tests(context.repo_name, context.project_type, self.pipeline_dir,
+                                          context.repo_directory, context, units)
 
-    def build_image(self):
-        """Build Docker image."""
+        context.check_cancelled()
+
+        if exit_code != 0:
+            raise RuntimeError(f"Tests failed with exit code {exit_code}: {context.test_summary}")
 
-        os.chdir(self.repo_directory)
-        git_service = GitService(self.repo_url, self.repo_directory, self.repo_name)
+        return exit_code
+
+    def select_tests(self, context):
+        """Returns test units affected by the pushed changes, None when the whole suite has to run.
+
+        Every few runs of a repository the whole suite runs regardless, as a safety net.
+        """
+
+        runs = self.runs_since_full_test.get(context.repo_name, 0) + 1
+
+        if runs >= config.TEST_IMPACT_FULL_RUN_EVERY or TestRunnerService.uses_test_target(context.repo_directory):
+            units = None
+        else:
+            if context.parent_run_id is not None:
+                changed_files = context.changed_files
+            else:
+                git_service = GitService(context.repo_url, context.repo_directory, context.repo_name)
+                changed_files = git_service.get_changed_files(context.before, context.commit)
+            all_units = test_units.discover_test_units(context.project_type, context.repo_directory)
+            units = None
+            if changed_files is not None:
+                units = test_units.select_affected_units(context.project_type, context.repo_directory, all_units,
+                                                         changed_files)
+
+        if units is None:
+            self.runs_since_full_test[context.repo_name] = 0
+            context.test_selection = {"mode": "full"}
+        else:
+            self.runs_since_full_test[context.repo_name] = runs
+            context.test_selection = {"mode": "affected", "units": units}
+
+        self.logger.log(f"Test selection for {context.key}: {context.test_selection}")
+
+        return units
+
+    def get_image_tag(self, context):
+        """Returns tag of the release image of the run's commit."""
+
+        git_service = GitService(context.repo_url, context.repo_directory, context.repo_name)
         sha = git_service.get_commit_sha()
-        os.chdir(self.pipeline_dir)
 
-        image_tag = f"{dockerhub_repo_name}/{self.repo_name}:{sha}"
+        return f"{dockerhub_repo_name}/{context.repo_name}:{sha}"
+
+    def get_result_cache_key(self, context):
+        """Returns key of the run's build inputs: source tree, test Dockerfile and project type."""
+
+        git_service = GitService(context.repo_url, context.repo_directory, context.repo_name)
+        tree_hash = git_service.get_tree_hash()
+
+        if TestRunnerService.uses_test_target(context.repo_directory):
+            test_dockerfile = f"target:{config.TEST_TARGET}"
+        else:
+            dockerfile_path = TestRunnerService.get_test_dockerfile(self.pipeline_dir, context.project_type)
+            test_dockerfile = UtilService.get_file_hash(dockerfile_path)
+
+        return get_cache_key(tree_hash, test_dockerfile, context.project_type, config.RELEASE_TARGET)
+
+    def reuse_cached_result(self, context):
+        """Tags the image already built from an identical source tree, skipping tests and build."""
+
+        if not config.RESULT_CACHE:
+            return False
+
+        context.cache_key = self.get_result_cache_key(context)
+        cached = result_cache.get(context.cache_key)
+
+        metrics.cache_requests.inc(cache="result", result="miss" if cached is None else "hit")
+
+        if cached is None:
+            return False
+
+        image_tag = self.get_image_tag(context)
+
+        self.logger.log(f"Source tree of {context.key} was already built as {cached['image_tag']}")
+
+        context.set_status("TAGGING CACHED IMAGE")
+
+        if not self.docker_service.tag_image(cached["image_id"], image_tag):
+            result_cache.remove(context.cache_key)
+            return False
+
+        context.cache_hit = True
+        context.image_tag = image_tag
+
+        self.logger.log(f"Built image tag is: {image_tag}")
+
+        return True
+
+    def store_result(self, context):
+        """Remembers the image built from the run's source tree."""
+
+        if context.cache_key is None:
+            return
+
+        image_id = self.docker_service.get_image_id(context.image_tag)
+
+        if image_id is not None:
+            result_cache.put(context.cache_key, {
+                "image_tag": context.image_tag,
+                "image_id": image_id,
+                "tests": context.test_summary,
+                "test_selection": context.test_selection,
+                "commit": context.commit
+            })
+
+    def build_image(self, context):
+        """Build Docker image."""
 
-        self.docker_service.run_docker_build(image_tag, self.repo_directory)
+        image_tag = self.get_image_tag(context)
 
-        self.last_tag_number = image_tag
+        target = config.RELEASE_TARGET or None
 
-        self.logger.log(f"Latest image tag is: {self.last_tag_number}")
+        if not self.docker_service.run_docker_build(image_tag, context.repo_directory, context, target=target):
+            context.check_cancelled()
+            raise RuntimeError(f"Failed to build image {image_tag}")
 
-    def push_image(self):
-        """Push image to DockerHub."""
+        context.image_tag = image_tag
 
-        self.docker_service.push_image(self.last_tag_number)
+        self.logger.log(f"Built image tag is: {image_tag}")
+
+    @staticmethod
+    def get_registry_tag(image_tag):
+        """Returns tag the image is pushed and pulled as in the configured registry."""
+
+        if config.REGISTRY_MODE == "local":
+            return f"{config.LOCAL_REGISTRY}/{image_tag}"
+        return image_tag
+
+    def push_image(self, context):
+        """Push image to the configured registry and start pulling it for the deployment.
+
+        Without Docker Hub no webhook announces the image, so the release listeners are notified instead.
+        """
+
+        image_tag = context.image_tag
+
+        if config.REGISTRY_MODE == "dockerhub":
+            if not self.docker_service.push_image(image_tag):
+                raise RuntimeError(f"Failed to push image {image_tag} to Docker Hub")
+            if config.DEPLOY_PREPULL:
+                self.prepull_image(image_tag)
+            return
+
+        if config.REGISTRY_MODE == "local":
+            registry_tag = self.get_registry_tag(image_tag)
+            if not (self.docker_service.tag_image(image_tag, registry_tag)
+                    and self.docker_service.push_image(registry_tag)):
+                raise RuntimeError(f"Failed to push image {registry_tag} to the local registry")
+
+        if config.REGISTRY_MIRROR:
+            self.logger.log(f"Mirroring image {image_tag} to Docker Hub in the background")
+            self.mirror_executor.submit(self.docker_service.push_image, image_tag)
+
+        for listener in self.release_listeners:
+            listener(image_tag)
+
+    def fetch_image(self, image_tag):
+        """Pulls the image from the configured registry, tagged with its Docker Hub name."""
+
+        registry_tag = self.get_registry_tag(image_tag)
+
+        if registry_tag == image_tag:
+            return self.docker_service.pull_image(image_tag)
+
+        return self.docker_service.pull_image(registry_tag) and self.docker_service.tag_image(registry_tag, image_tag)
+
+    def prepull_image(self, image_tag):
+        """Starts pulling the pushed image in the background, so its deployment does not wait for it."""
+
+        with self.lock:
+            # Finished pre-pulls are forgotten, the deployment finds their image already local
+            self.prepulls = {tag: future for tag, future in self.prepulls.items() if not future.done()}
+
+            if image_tag not in self.prepulls:
+                self.logger.log(f"Pre-pulling image {image_tag}")
+                self.prepulls[image_tag] = self.prepull_executor.submit(self.fetch_image, image_tag)
 
     def pull_image(self, image_tag):
-        """Pull image from Docker Hub."""
+        """Pull image from the registry, waiting for its pre-pull instead if one is running."""
 
-        self.docker_service.pull_image(image_tag)
+        if config.REGISTRY_MODE == "none":
+            # Images are deployed on the host they were built on
+            return
 
-    def deploy_image(self, image_tag, deployment_params):
-        """Deploys the specified image"""
+        with self.lock:
+            prepull = self.prepulls.pop(image_tag, None)
+
+        if prepull is not None:
+            self.logger.log(f"Waiting for pre-pull of image {image_tag}")
+            if prepull.result():
+                return
+
+        self.fetch_image(image_tag)
+
+    def deploy_image(self, context, deployment_params, previous_container_id=None):
+        """Deploys the specified image, restarting the previous container if it fails"""
 
         service = DockerService()
 
+        image_tag = context.image_tag
+        image_name = context.repo_name
+
         deployed_container_id = service.deploy_image(image_tag, deployment_params)
 
         self.logger.log(f"Image to be deployed: {image_tag}")
 
-        if id is None:
-            self.rollback_to_previous_container()
-        else:
-            self.deployed_container_id = deployed_container_id
+        if deployed_container_id is None:
+            self.rollback_to_previous_container(image_name, previous_container_id)
+            raise RuntimeError(f"Failed to deploy {image_tag}, rolled back to the previous container")
+
+        self.deployed_container_ids[image_name] = deployed_container_id
+        context.deployed_container_id = deployed_container_id
 
         self.logger.log(f"Deployed container id: {deployed_container_id}")
 
-    def stop_deployed_container(self):
+    def stop_deployed_container(self, image_name, container_id=None):
         """Stops the currently deployed container"""
 
         service = DockerService()
 
-        container_to_be_stopped = self.deployed_container_id
+        container_to_be_stopped = container_id or self.deployed_container_ids.get(image_name)
 
         if container_to_be_stopped is None:
             self.logger.log("There is no deployed container or none to be stopped")
@@ -211,21 +849,19 @@ class TinyCICDService:
 
             service.stop_running_container(container_to_be_stopped)
 
-    def rollback_to_previous_container(self):
-        """Restart the paused container"""
+    def rollback_to_previous_container(self, image_name, container_id=None):
+        """Restart the stopped container"""
 
         service = DockerService()
 
-        container_to_be_restarted = self.deployed_container_id
+        container_to_be_restarted = container_id or self.deployed_container_ids.get(image_name)
 
         if container_to_be_restarted is None:
             self.logger.log("There is no previous container to rollback to")
-        else:
-            self.logger.log(f"Container to be restarted: {container_to_be_restarted}")
-
-            container_id = service.run_container(container_to_be_restarted)
+        elif service.run_container(container_to_be_restarted):
+            self.logger.log(f"Restarted container: {container_to_be_restarted}")
 
-            self.deployed_container_id = container_id
+            self.deployed_container_ids[image_name] = container_to_be_restarted
 
     def remove_paused_container(self, old_container_id):
         """Removes paused containers"""
@@ -259,94 +895,181 @@ class TestRunnerService:
 
     logger = Logger("TestRunnerService")
 
+    # Directories the test-runner templates write test reports to
+    report_directories = {
+        "MAVEN": "/app/target/surefire-reports",
+        "DOTNET": "/app/test-reports",
+        "PYTHON": "/app/test-reports",
+        "GRADLE": "/app/build/test-results/test"
+    }
+
     def __init__(self):
-        self.saved_dockerfile_content = ""
         return
 
-    def run_tests(self, repo_name, project_type, src_dir, project_dir):
-        """Runs test suite for the managed project."""
+    def run_tests(self, repo_name, project_type, src_dir, project_dir, context=None, units=None):
+        """Runs test suite for the managed project, or only the given test units."""
 
-        image_tag = self.build_test_image(repo_name, project_type, src_dir, project_dir)
+        if units is not None and not units:
+            self.logger.log(f"No tests of {project_dir} are affected by the changes, skipping them")
+            if context is not None:
+                context.test_summary = reports.summarize([])
+            return 0
 
-        return self.run_test_container(image_tag, project_dir)
+        image_tag = self.build_test_image(repo_name, project_type, src_dir, project_dir, context)
 
-    def build_test_image(self, repo_name, project_type, src_dir, project_dir):
-        """Builds test image for the managed project."""
-        image_tag = f"tiny-cicd-testrunner-{repo_name}".lower()
-        dockerfile = "Dockerfile"
-
-        self.logger.log(f"Building Docker image with tag: {image_tag}")
+        # The test stage shares its layers with the release build, keep it until the release image is built
+        keep_image = context is not None and self.uses_test_target(project_dir)
+        if keep_image:
+            context.test_image_tag = image_tag
 
-        if self.remove_existing_dockerfile(project_dir, dockerfile):
-            self.copy_dockerfile(src_dir, project_type, dockerfile, project_dir)
+        return self.run_test_container(image_tag, project_dir, context, cleanup=not keep_image,
+                                       project_type=project_type, units=units)
 
+    def build_test_image(self, repo_name, project_type, src_dir, project_dir, context=None):
+        """Builds test image for the managed project."""
+        image_tag = f"tiny-cicd-testrunner-{repo_name}".lower()
+        if context is not None:
+            image_tag = f"{image_tag}-{context.run_id[:12]}"
         service = DockerService()
 
-        if service.run_docker_build(image_tag, project_dir):
+        if self.uses_test_target(project_dir):
+            self.logger.log(f"Building Docker image with tag: {image_tag} from target {config.TEST_TARGET}")
+            built = service.run_docker_build(image_tag, project_dir, context, target=config.TEST_TARGET)
+        else:
+            dockerfile = self.get_test_dockerfile(src_dir, project_type)
+            self.logger.log(f"Building Docker image with tag: {image_tag} from {dockerfile}")
+            # Dependency cache mounts of the templates are kept per repository
+            build_args = {"CACHE_ID": repo_name.lower()}
+            built = service.run_docker_build(image_tag, project_dir, context, dockerfile, build_args=build_args)
+
+        if built:
             self.logger.log(f"Successfully built Docker image: {image_tag}")
             return image_tag
         else:
             self.logger.log("Error building Docker image.")
             return None
 
-    def remove_existing_dockerfile(self, project_dir, dockerfile):
-        """Removes existing Dockerfile from repository."""
-        dockerfile_path = os.path.join(project_dir, dockerfile)
-        if os.path.exists(dockerfile_path):
-            self.logger.log(f"Removing existing Dockerfile from project directory: {project_dir}")
+    @staticmethod
+    def uses_test_target(project_dir):
+        """Checks if tests are run from the test stage of the project's own multi-stage Dockerfile."""
+
+        if config.BUILD_MODE != "multistage":
+            return False
+
+        dockerfile_path = os.path.join(project_dir, "Dockerfile")
+
+        return config.TEST_TARGET in UtilService.get_dockerfile_stages(dockerfile_path)
+
+    @staticmethod
+    def get_test_dockerfile(src_dir, project_type):
+        """Returns path of the test Dockerfile template for the project type."""
+        return os.path.join(src_dir, "test-runner", project_type.lower(), "Dockerfile")
+
+    def run_test_container(self, image_tag, project_dir, context=None, cleanup=True, project_type=None, units=None):
+        """Runs testing suite in a sibling container, or split into shards in parallel sibling containers"""
+
+        shards = None
+        if config.TEST_SHARDS > 1 and not self.uses_test_target(project_dir):
+            shards = self.get_test_shards(context.repo_name if context else "", project_type, project_dir, units)
+        if not shards and units:
+            shards = [units]
+
+        if shards:
+            exit_code, report_files, output_lines = self.run_test_shards(image_tag, project_type, shards, context)
+        else:
             service = DockerService()
-            self.saved_dockerfile_content = service.read_dockerfile_content(dockerfile_path)
-            os.remove(dockerfile_path)
-            return True
-        return False
+            report_files = []
+            output_lines = []
+            exit_code = service.run_docker_image(image_tag, context, self.report_directories.get(project_type),
+                                                 report_files, output_lines=output_lines)
+
+        if context is not None:
+            self.collect_test_results(context, project_type, report_files, output_lines)
+
+        if cleanup:
+            self.cleanup_after_tests(image_tag, project_dir)
 
-    def copy_dockerfile(self, src_dir, project_type, dockerfile, project_dir):
-        """Copies the test Dockerfile template into the repository folder."""
-        dockerfile_source_path = os.path.join(src_dir, "test-runner", project_type.lower(), dockerfile)
-        dockerfile_destination_path = project_dir
+        return exit_code
+
+    def get_test_shards(self, repo_name, project_type, project_dir, units=None):
+        """Splits test units of the project into shards balanced by their historical durations."""
+
+        if units is None:
+            units = test_units.discover_test_units(project_type, project_dir)
+
+        if not units or len(units) < 2:
+            self.logger.log(f"Tests of {project_dir} cannot be split into shards, running them at once")
+            return None
+
+        durations = test_units.get_unit_durations(project_type, units, test_duration_history.load(repo_name))
+
+        return test_units.balance_shards(units, durations, config.TEST_SHARDS)
 
-        shutil.copy(dockerfile_source_path, dockerfile_destination_path)
-        self.logger.log(
-            f"{dockerfile} copied successfully from '{dockerfile_source_path}' to '{dockerfile_destination_path}'.")
+    def run_test_shards(self, image_tag, project_type, shards, context=None):
+        """Runs shards of the test suite in parallel containers and merges their results.
 
-    def restore_dockerfile(self, project_dir):
-        """Restores removed Dockerfile"""
+        Returns the first non-zero exit code, report files and output lines of all shards.
+        """
 
-        if os.path.exists(os.path.join(project_dir, "Dockerfile")):
-            print(os.path.join(project_dir, "Dockerfile"))
-            os.remove(os.path.join(project_dir, "Dockerfile"))
-            self.logger.log(f"Restoring Dockerfile to directory: {project_dir}")
+        limits = {}
+        if config.TEST_SHARD_CPUS:
+            limits["nano_cpus"] = int(config.TEST_SHARD_CPUS * 1e9)
+        if config.TEST_SHARD_MEMORY:
+            limits["mem_limit"] = config.TEST_SHARD_MEMORY
+
+        def run_shard(index, units):
             service = DockerService()
-            service.write_content_to_dockerfile(self.saved_dockerfile_content,
-                                                (os.path.join(project_dir, "Dockerfile")))
-            self.logger.log("Successfully written to file")
+            report_files = []
+            output_lines = []
+            command = test_units.get_test_command(project_type, units)
+            self.logger.log(f"Running shard {index + 1}/{len(shards)} of {image_tag}: {command}")
+            with run_scope(context):
+                exit_code = service.run_docker_image(image_tag, context, self.report_directories.get(project_type),
+                                                     report_files, command, limits, output_lines,
+                                                     f"shard {index + 1}/{len(shards)}")
+            return exit_code, report_files, output_lines
 
-    def run_test_container(self, image_tag, project_dir):
-        """Runs testing suite in a sibling container"""
+        with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+            shard_results = list(executor.map(run_shard, range(len(shards)), shards))
 
-        os.chdir(pipeline_dir)
+        exit_codes = [exit_code for exit_code, _, _ in shard_results]
+        failed = [exit_code for exit_code in exit_codes if exit_code != 0]
 
-        service = DockerService()
+        merged_report_files = [report for _, report_files, _ in shard_results for report in report_files]
+        merged_output_lines = [line for _, _, output_lines in shard_results for line in output_lines]
 
-        exit_code = service.run_docker_image(image_tag)
+        return (failed[0] if failed else 0), merged_report_files, merged_output_lines
 
-        self.cleanup_after_tests(image_tag, project_dir)
+    def collect_test_results(self, context, project_type, report_files, output_lines=None):
+        """Parses test reports of the run and records durations of its tests."""
 
-        return exit_code
+        results = []
+
+        if project_type == "GO":
+            results = reports.parse_go_test_output(output_lines or [])
+
+        for name, content in report_files:
+            parsed = reports.parse_report(name, content)
+            if parsed is not None:
+                results += parsed
+
+        context.test_results = results
+        context.test_summary = reports.summarize(results)
+
+        self.logger.log(f"Test results of {context.key}: {context.test_summary}")
+
+        if results:
+            test_duration_history.record(context.repo_name, results)
 
     def cleanup_after_tests(self, image_tag, project_dir):
         """Cleans up test container and image"""
 
-        os.chdir(pipeline_dir)
-
         try:
 
             service = DockerService()
 
             service.remove_docker_image(image_tag)
 
-            self.restore_dockerfile(project_dir)
-
         except docker.errors.ImageNotFound:
             self.logger.log(f"Docker image not found: {image_tag}", "error")
             return False
@@ -363,48 +1086,26 @@ class UtilService:
     def __init__(self):
         return
 
-    def get_project_type(self, repo_directory):
-        """Detects the type of the project."""
+    def get_project_type(self, repo_directory, repo_name=None):
+        """Detects the type of the project in the root of the repository."""
 
         self.logger.log(f"Detecting project type for {repo_directory}")
 
-        if self.is_maven_project(repo_directory) is True:
-            return "MAVEN"
-        elif self.is_dotnet_project(repo_directory) is True:
-            return "DOTNET"
-        elif self.is_python_project(repo_directory) is True:
-            return "PYTHON"
-        elif self.is_go_project(repo_directory) is True:
-            return "GO"
-        else:
-            return "UNSUPPORTED"
+        return self.get_root_project_type(self.detect_projects(repo_directory, repo_name))
 
     @staticmethod
-    def is_maven_project(repo_directory):
-        """Check if project is a Maven project (checks for pom.xml file)."""
-        pom_xml_path = os.path.join(repo_directory, "pom.xml")
-        return os.path.exists(pom_xml_path)
+    def get_root_project_type(projects):
+        """Returns type of the project in the root of the repository, UNSUPPORTED for a monorepo."""
 
-    @staticmethod
-    def is_dotnet_project(repo_directory):
-        """Check if project is a .NET project (checks for .csproj file)."""
-        for filename in os.listdir(repo_directory):
-            if filename.endswith(".csproj") or filename.endswith(".cs"):
-                return True
-        return False
-
-    @staticmethod
-    def is_python_project(repo_directory):
-        """Check if project is a Python project (checks for requirements.txt file)"""
-        requirements_txt_path = os.path.join(repo_directory, "requirements.txt")
-        setup_py_path = os.path.join(repo_directory, "setup.py")
-        return os.path.exists(requirements_txt_path) or os.path.exists(setup_py_path)
+        for project in projects:
+            if project["path"] == "":
+                return project["type"]
+        return "UNSUPPORTED"
 
     @staticmethod
-    def is_go_project(repo_directory):
-        """Check if project is a Go project (checks for "go.mod" file)"""
-        go_mod_path = os.path.join(repo_directory, "go.mod")
-        return os.path.exists(go_mod_path)
+    def detect_projects(repo_directory, repo_name=None):
+        """Detects projects of the repository, several of them in a monorepo."""
+        return project_detection.detect_projects(repo_directory, repo_name)
 
     def resolve_repository_name(self, url):
         """Get repository name from the git repository url."""
@@ -418,16 +1119,46 @@ class UtilService:
             self.logger.log(f"Name resolved to {name}", "info")
             return name
 
+    @staticmethod
+    def get_file_hash(path):
+        """Returns SHA-256 of the file content, empty if it does not exist."""
+
+        if not os.path.exists(path):
+            return ""
+
+        with open(path, 'rb') as file:
+            return hashlib.sha256(file.read()).hexdigest()
+
+    @staticmethod
+    def get_dockerfile_stages(dockerfile_path):
+        """Returns names of the stages declared in a multi-stage Dockerfile."""
+
+        if not os.path.exists(dockerfile_path):
+            return []
+
+        stages = []
+
+        with open(dockerfile_path, 'r', encoding="UTF-8") as file:
+            for line in file:
+                words = line.split()
+                if len(words) >= 4 and words[0].upper() == "FROM" and words[-2].upper() == "AS":
+                    stages.append(words[-1])
+
+        return stages
+
     @staticmethod
     def parse_docker_image_tag(image_tag):
-        """Parse Docker image tag <repository>/<image_name>:<tag> into repository, image name, and tag."""
-        if ':' in image_tag:
-            repository_image, tag = image_tag.split(':')
+        """Parse Docker image tag <repository>/<image_name>:<tag> into repository, image name, and tag.
+
+        The repository may start with a registry host, e.g. localhost:5500/kapiaszczyk.
+        """
+        if ':' in image_tag.rsplit('/', 1)[-1]:
+            repository_image, tag = image_tag.rsplit(':', 1)
         else:
             repository_image = image_tag
             tag = None
 
-        repository, image_name = repository_image.split('/', 1)
+        repository, image_name = repository_image.rsplit('/', 1)
 
         return repository, image_name, tag
 
@@ -442,18 +1173,68 @@ class GitService:
         self.repo_directory = repo_directory
         self.repo_name = repo_name
         self.repo_url = repo_url
+        self.mirror_directory = os.path.join(pipeline_dir, config.GIT_MIRROR_DIR, f"{repo_name}.git")
 
-    def resolve_code(self):
+    @timed("git_fetch")
+    def resolve_code(self, commit=None):
         """Pull code from GitHub."""
 
-        os.chdir(pipeline_dir)
-
-        if self.is_repo_cloned():
+        if config.GIT_FETCH_MODE == "mirror":
+            self.resolve_code_from_mirror(commit)
+        elif self.is_repo_cloned():
             self.pull_code()
         else:
             self.clone_repository()
 
-        os.chdir(pipeline_dir)
+    def resolve_code_from_mirror(self, commit=None):
+        """Fetches the commit into the bare mirror of the repository and checks it out into a worktree of its own.
+
+        The repository directory is pointed at the worktree, which stays reserved until release_code is called.
+        """
+
+        with worktree_pool.get_mirror_lock(self.mirror_directory):
+            revision = self.update_mirror(commit)
+
+        self.repo_directory = worktree_pool.acquire(self.repo_name, self.mirror_directory, revision)
+
+    def release_code(self):
+        """Returns the worktree of the run to the pool."""
+
+        if config.GIT_FETCH_MODE == "mirror":
+            worktree_pool.release(self.repo_name, self.repo_directory, self.mirror_directory)
+
+    def update_mirror(self, commit=None):
+        """Creates the bare mirror if needed, fetches the commit, or the remote HEAD, into it and returns its SHA."""
+
+        if not os.path.exists(self.mirror_directory):
+            self.logger.log(f"Creating mirror of {self.repo_url} in {self.mirror_directory}", "info")
+            os.makedirs(self.mirror_directory)
+            subprocess.check_call(["git", "init", "--bare", "--quiet"], cwd=self.mirror_directory)
+            subprocess.check_call(["git", "remote", "add", "origin", self.repo_url], cwd=self.mirror_directory)
+
+        if commit is not None and self.mirror_has_commit(commit):
+            self.logger.log(f"Commit {commit} is already in the mirror", "info")
+            return commit
+
+        fetch_cmd = ["git", "fetch", "--quiet", "--no-tags"]
+        if config.GIT_SHALLOW:
+            fetch_cmd.append("--depth=1")
+        if config.GIT_FILTER:
+            fetch_cmd.append(f"--filter={config.GIT_FILTER}")
+        fetch_cmd += ["origin", commit or "HEAD"]
+
+        self.logger.log(f"Fetching {commit or 'HEAD'} into the mirror: {fetch_cmd}", "info")
+
+        subprocess.check_call(fetch_cmd, cwd=self.mirror_directory)
+
+        return git.Repo(self.mirror_directory).git.rev_parse("FETCH_HEAD")
+
+    def mirror_has_commit(self, commit):
+        """Checks if the commit is already present in the mirror."""
+
+        result = subprocess.run(["git", "cat-file", "-e", f"{commit}^{{commit}}"], cwd=self.mirror_directory,
+                                 capture_output=True, check=False)
+        return result.returncode == 0
 
     def is_repo_cloned(self):
         """Check if provided directory exists and/or create it"""
@@ -489,16 +1270,14 @@ class GitService:
 
         self.logger.log("Cloning code from the repository", "info")
 
-        os.chdir(deployments_dir)
-        subprocess.check_call(["git", "clone", self.repo_url])
+        subprocess.check_call(["git", "clone", self.repo_url, self.repo_directory])
 
     def pull_code(self):
         """Pull code from GitHub and check repository cleanliness."""
 
         self.logger.log("Pulling code from the repository", "info")
 
-        os.chdir(self.repo_directory)
-        subprocess.check_call(["git", "pull", self.repo_url])
+        subprocess.check_call(["git", "pull", self.repo_url], cwd=self.repo_directory)
 
         if self.is_repo_clean():
             self.logger.log("Repository is clean", "info")
@@ -511,43 +1290,109 @@ class GitService:
 
         self.logger.log("Checking if repository is clean", "info")
 
-        result = subprocess.check_call(["git", "status", "--porcelain"])
+        repo = git.Repo(self.repo_directory)
 
-        if result == 0:
-            return True
-        else:
-            return False
+        return not repo.is_dirty(untracked_files=True)
 
     def rollback_state(self):
         """Roll back the repository to a clean state (reset changes)."""
 
         self.logger.log("Rolling back repository to clean state", "info")
 
-        subprocess.check_call(["git", "reset", "--hard"])
+        subprocess.check_call(["git", "reset", "--hard"], cwd=self.repo_directory)
 
 
+    def get_changed_files(self, before, after):
+        """Returns paths of the files changed between two commits, None if they cannot be compared."""
+
+        if not before or not after or set(before) == {"0"}:
+            return None
+
+        try:
+            if config.GIT_FETCH_MODE == "mirror":
+                with worktree_pool.get_mirror_lock(self.mirror_directory):
+                    self.update_mirror(before)
+
+            output = git.Repo(self.repo_directory).git.diff("--name-only", "--no-renames", before, after)
+        except (git.exc.GitError, subprocess.CalledProcessError) as e:
+            self.logger.log(f"Failed to compare {before} and {after}: {e}", "error")
+            return None
+
+        return [path for path in output.splitlines() if path]
+
+    def get_tree_hash(self):
+        """Returns hash of the source tree of the checked out commit, of the subtree for a subproject."""
+
+        try:
+            repo = git.Repo(self.repo_directory, search_parent_directories=True)
+            path = os.path.relpath(self.repo_directory, repo.working_tree_dir).replace(os.sep, "/")
+            return repo.git.rev_parse("HEAD^{tree}" if path == "." else f"HEAD:{path}")
+        except git.exc.GitError as e:
+            raise RuntimeError(f"Error running Git command: {e}")
+
     def get_commit_sha(self):
         """Returns last commit SHA."""
 
         self.logger.log("Retrieving last commit SHA")
 
-        command = "git rev-parse --short HEAD"
-
         try:
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True
-            )
+            return git.Repo(self.repo_directory, search_parent_directories=True).git.rev_parse("HEAD", short=True)
+        except git.exc.GitError as e:
+            raise RuntimeError(f"Error running Git command: {e}")
 
-            if result.returncode == 0:
-                return result.stdout.strip()
-            else:
-                raise RuntimeError(f"Git command failed with error:\n{result.stderr}")
 
-        except subprocess.CalledProcessError as e:
-            raise RuntimeError(f"Error running Git command: {e}")
+class BuildStepTimer:
+    """Measures durations of the steps of a docker build from its output."""
+
+    legacy_step = re.compile(r"^Step (\d+/\d+) : (.*)$")
+    buildkit_step = re.compile(r"^#(\d+) \[(.+?)\] (.*)$")
+    buildkit_done = re.compile(r"^#(\d+) (DONE|CACHED)(?: (\d+(?:\.\d+)?)s)?$")
+
+    def __init__(self):
+        self.steps = []
+        self.current_step = None
+        self.current_step_started = None
+        self.buildkit_names = {}
+
+    def feed(self, line):
+        """Processes a line of the build output."""
+
+        match = self.legacy_step.match(line)
+        if match:
+            self.close_current_step()
+            self.current_step = f"[{match.group(1)}] {match.group(2)}"
+            self.current_step_started = time.monotonic()
+            return
+
+        match = self.buildkit_step.match(line)
+        if match:
+            self.buildkit_names.setdefault(match.group(1), f"[{match.group(2)}] {match.group(3)}")
+            return
+
+        match = self.buildkit_done.match(line)
+        if match and match.group(1) in self.buildkit_names:
+            self.steps.append({
+                "step": self.buildkit_names.pop(match.group(1)),
+                "seconds": float(match.group(3) or 0),
+                "cached": match.group(2) == "CACHED"
+            })
+
+    def close_current_step(self):
+        """Records duration of the legacy builder step in progress."""
+
+        if self.current_step is not None:
+            self.steps.append({
+                "step": self.current_step,
+                "seconds": round(time.monotonic() - self.current_step_started, 3),
+                "cached": False
+            })
+            self.current_step = None
+
+    def finish(self):
+        """Returns durations of all steps once the build ends."""
+
+        self.close_current_step()
+        return self.steps
 
 
 class DockerService:
@@ -556,54 +1401,220 @@ class DockerService:
     logger = Logger("DockerService")
 
     def __init__(self):
-        self.client = docker.from_env()
+        self.client = get_docker_client()
 
-    @staticmethod
-    def read_dockerfile_content(path):
-        """Reads Dockerfile content and returns it as a string."""
-        with open(path, 'r', encoding="UTF-8") as file:
-            dockerfile_content = file.read()
-            return dockerfile_content
+    @timed("docker_build")
+    def run_docker_build(self, image_tag, build_directory, context=None, dockerfile=None, target=None,
+                         build_args=None):
+        """Runs docker image build process, streaming its output into the run, aborting it if the run gets cancelled.
+
+        The Dockerfile may live outside the build directory, which is left untouched.
+        """
+
+        dockerfile_path = dockerfile or os.path.join(build_directory, "Dockerfile")
+
+        # The test-runner templates use cache mounts, which only BuildKit supports
+        if self.requires_buildkit(dockerfile_path):
+            lines = self.stream_cli_build(image_tag, build_directory, context, dockerfile, target, build_args)
+        else:
+            lines = self.stream_api_build(image_tag, build_directory, context, dockerfile, target, build_args)
+
+        timer = BuildStepTimer()
+
+        try:
+            for line in lines:
+                timer.feed(line)
+                self.logger.log(f"Build {image_tag}: {line}")
+                if context is not None:
+                    context.append_output(line)
+        except (docker.errors.BuildError, docker.errors.APIError, subprocess.CalledProcessError) as e:
+            self.logger.log(f"Error building Docker image: {e}")
+            return False
+        except OSError as e:
+            self.logger.log(f"Failed to run docker CLI to build {image_tag}: {e}", "error")
+            return False
+        finally:
+            steps = timer.finish()
+            if context is not None:
+                context.build_steps.append({"image": image_tag, "steps": steps})
+
+        if context is not None and context.is_cancelled():
+            self.logger.log(f"Build of {image_tag} was cancelled")
+            return False
+
+        return True
 
     @staticmethod
-    def write_content_to_dockerfile(content, path):
-        """Writes content to Dockerfile."""
-        with open(path, 'w', encoding="UTF-8") as file:
-            file.write(content)
+    def requires_buildkit(dockerfile_path):
+        """Checks if the Dockerfile uses features the API's legacy builder does not support."""
+
+        if not os.path.exists(dockerfile_path):
+            return False
+
+        with open(dockerfile_path, 'r', encoding="UTF-8") as file:
+            content = file.read()
 
-    def run_docker_build(self, image_tag, build_directory):
-        """Runs docker image build process."""
+        return "# syntax=" in content or "--mount=" in content
 
-        previous_directory = os.getcwd()
+    def stream_api_build(self, image_tag, build_directory, context=None, dockerfile=None, target=None,
+                         build_args=None):
+        """Builds the image through the Docker API and yields its output line by line."""
 
-        os.chdir(build_directory)
+        self.logger.log(f"Building {image_tag} through the Docker API")
 
-        docker_build_cmd = ["docker", "build", "-t", image_tag, "."]
+        build_responses.response = None
+
+        output = self.client.api.build(path=build_directory, tag=image_tag, dockerfile=dockerfile, target=target,
+                                       buildargs=build_args, rm=True, decode=True)
+
+        # The request was sent by this thread, the hook handed its response over
+        response = build_responses.response
+        build_responses.response = None
+
+        cancelled = threading.Event()
+
+        def cancel():
+            cancelled.set()
+            self.abort_api_build(image_tag, response)
+
+        if context is None:
+            yield from self.read_api_build_output(output, cancelled)
+        else:
+            with context.cancellable(cancel):
+                yield from self.read_api_build_output(output, cancelled)
+
+    def abort_api_build(self, image_tag, response):
+        """Shuts down the connection of a Docker API build, the daemon then drops the build.
+
+        Unblocks the thread waiting for the next output of a long step, closing the output
+        stream itself is not possible while that thread reads from it.
+        """
+
+        connection = getattr(getattr(response, "raw", None), "connection", None)
+        sock = getattr(connection, "sock", None)
+
+        if sock is None:
+            self.logger.log(f"Cannot abort build of {image_tag}, its connection to the Docker daemon is unknown. "
+                            f"The build continues until its next output", "error")
+            return
+
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError as e:
+            self.logger.log(f"Failed to abort build of {image_tag}: {e}", "error")
+
+    @staticmethod
+    def read_api_build_output(output, cancelled):
+        """Yields lines of the Docker API build output until it ends or the build gets cancelled."""
+
+        try:
+            for chunk in output:
+                if "error" in chunk:
+                    raise docker.errors.BuildError(chunk["error"].strip(), [])
+                for line in chunk.get("stream", "").splitlines():
+                    if line.strip():
+                        yield line
+                if cancelled.is_set():
+                    return
+        except Exception:
+            # Aborting the build breaks the connection it is read from
+            if cancelled.is_set():
+                return
+            raise
+        finally:
+            output.close()
+
+    def stream_cli_build(self, image_tag, build_directory, context=None, dockerfile=None, target=None,
+                         build_args=None):
+        """Builds the image with the BuildKit enabled docker CLI and yields its output line by line."""
+
+        docker_build_cmd = ["docker", "build", "--progress=plain", "-t", image_tag]
+        if dockerfile is not None:
+            docker_build_cmd += ["-f", dockerfile]
+        if target is not None:
+            docker_build_cmd += ["--target", target]
+        for name, value in (build_args or {}).items():
+            docker_build_cmd += ["--build-arg", f"{name}={value}"]
+        docker_build_cmd.append(".")
         self.logger.log(f"Running Docker build command: {docker_build_cmd}")
 
+        env = dict(os.environ)
+        env["DOCKER_BUILDKIT"] = "1"
+
+        process = subprocess.Popen(docker_build_cmd, cwd=build_directory, env=env, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT, text=True)
+
+        if context is None:
+            yield from self.read_cli_build_output(process, docker_build_cmd)
+        else:
+            with context.cancellable(process.terminate):
+                yield from self.read_cli_build_output(process, docker_build_cmd)
+
+    @staticmethod
+    def read_cli_build_output(process, docker_build_cmd):
+        """Yields lines of the docker CLI build output and raises if the build fails."""
+
         try:
-            subprocess.check_call(docker_build_cmd)
-            os.chdir(previous_directory)
-            return True
+            for line in process.stdout:
+                if line.strip():
+                    yield line.rstrip()
+        finally:
+            process.stdout.close()
+            return_code = process.wait()
+
+        if return_code != 0:
+            raise subprocess.CalledProcessError(return_code, docker_build_cmd)
+
+    def prune_build_cache(self, max_size):
+        """Evicts least recently used BuildKit cache mounts until they fit in the given size."""
+
+        prune_cmd = ["docker", "builder", "prune", "--force", "--filter", "type=exec.cachemount",
+                     "--keep-storage", max_size]
+
+        try:
+            subprocess.run(prune_cmd, check=True, capture_output=True)
         except subprocess.CalledProcessError as e:
-            self.logger.log(f"Error building Docker image: {e}")
-            os.chdir(previous_directory)
-            return False
+            self.logger.log(f"Failed to prune build cache: {e.stderr}", "error")
+        except OSError as e:
+            self.logger.log(f"Failed to run docker CLI to prune build cache: {e}", "error")
 
-    def run_docker_image(self, image_tag):
-        """Runs specified docker image and returns container exit status code."""
+    @timed("test_container")
+    def run_docker_image(self, image_tag, context=None, report_directory=None, report_files=None, command=None,
+                         limits=None, output_lines=None, label=None):
+        """Runs specified docker image and returns container exit status code.
+
+        Container output is streamed into the run as it is produced and appended to output_lines.
+        Files found in the report directory after the container exits are appended to report_files
+        as (name, content) pairs. Limits are passed to the container as resource constraints.
+        The container is stopped if the run gets cancelled while it is running.
+        """
 
         if not image_tag:
             self.logger.log("No image tag provided.")
             return
 
+        exit_code = None
+
         try:
             container = self.client.containers.run(
                 image=image_tag,
+                command=command,
                 detach=True,
+                **(limits or {})
             )
 
-            result = container.wait()
+            if context is None:
+                self.stream_container_output(container, image_tag, output_lines=output_lines, label=label)
+                result = container.wait()
+            else:
+                # Killing returns at once, test processes running as PID 1 would ignore the stop signal
+                with context.cancellable(container.kill):
+                    self.stream_container_output(container, image_tag, context, output_lines, label)
+                    result = container.wait()
+
+            if report_directory is not None and report_files is not None:
+                report_files += self.copy_files_from_container(container, report_directory)
+
             container.remove()
 
             exit_code = result["StatusCode"]
@@ -619,6 +1630,81 @@ class DockerService:
 
         return exit_code
 
+    def stream_container_output(self, container, image_tag, context=None, output_lines=None, label=None):
+        """Logs container output line by line until the container exits.
+
+        Lines kept in the run's output are prefixed with the label, if given.
+        """
+
+        pending = ""
+
+        for chunk in container.logs(stream=True, follow=True):
+            pending += chunk.decode("UTF-8", errors="replace")
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                self.log_container_line(line, image_tag, context, output_lines, label)
+
+        if pending:
+            self.log_container_line(pending, image_tag, context, output_lines, label)
+
+    def log_container_line(self, line, image_tag, context=None, output_lines=None, label=None):
+        """Logs a line of container output and keeps it in the run's output."""
+
+        line = line.rstrip()
+
+        self.logger.log(f"Container {label or image_tag}: {line}")
+
+        if output_lines is not None:
+            output_lines.append(line)
+
+        if context is not None:
+            context.append_output(f"[{label}] {line}" if label else line)
+
+    def copy_files_from_container(self, container, path):
+        """Returns (name, content) pairs of the files under the path in a stopped container."""
+
+        files = []
+
+        try:
+            stream, _ = container.get_archive(path)
+        except docker.errors.NotFound:
+            self.logger.log(f"No files found in {path} of the container")
+            return files
+
+        archive = tarfile.open(fileobj=io.BytesIO(b"".join(stream)))
+
+        for member in archive.getmembers():
+            if member.isfile():
+                files.append((member.name, archive.extractfile(member).read()))
+
+        return files
+
+    def get_image_id(self, image_tag):
+        """Returns id of the image with the tag or None."""
+
+        try:
+            return self.client.images.get(image_tag).id
+        except docker.errors.ImageNotFound:
+            self.logger.log(f"Docker image not found: {image_tag}", "error")
+            return None
+
+    def tag_image(self, image_id, image_tag):
+        """Tags an existing image, returns False if it is gone."""
+
+        repository, tag = image_tag.rsplit(":", 1)
+
+        try:
+            image = self.client.images.get(image_id)
+            image.tag(repository, tag)
+            self.logger.log(f"Tagged image {image_id} as {image_tag}")
+            return True
+        except docker.errors.ImageNotFound:
+            self.logger.log(f"Docker image not found: {image_id}", "error")
+            return False
+        except docker.errors.APIError as e:
+            self.logger.log(f"Failed to tag image {image_id} as {image_tag}: {e}", "error")
+            return False
+
     def remove_docker_image(self, image_tag):
         """Removes docker image from the image list."""
 
@@ -635,8 +1721,9 @@ class DockerService:
             self.logger.log(f"An error occurred while removing Docker image: {e}", "error")
             return False
 
+    @timed("docker_push")
     def push_image(self, image_tag):
-        """Pushes image to Docker Hub."""
+        """Pushes image to Docker Hub, or to the registry its tag starts with."""
 
         util_service = UtilService()
 
@@ -647,27 +1734,79 @@ class DockerService:
         try:
             for line in self.client.images.push(image_name, stream=True, decode=True):
                 if 'status' in line:
-                    self.logger.log(f"Pushing: {line['status']}", "info")
+                    self.logger.log_progress(f"push:{image_name}", f"Pushing: {line['status']}", "info")
 
+            self.logger.end_progress(f"push:{image_name}")
             self.logger.log(f"Successfully pushed image to Docker Hub: {image_name}", "info")
+            return True
 
         except docker.errors.APIError as e:
             self.logger.log(f"Failed to push image to Docker Hub with reason: {e}", "error")
+            return False
+
+    def is_image_current(self, image_tag):
+        """Returns True if the image with the tag is local and has the digest of the tag in the registry.
+
+        If the registry cannot be reached, the local image is used as is.
+        """
+
+        try:
+            image = self.client.images.get(image_tag)
+        except docker.errors.ImageNotFound:
+            return False
+        except docker.errors.APIError as e:
+            self.logger.log(f"Failed to inspect image {image_tag}: {e}", "error")
+            return False
+
+        try:
+            digest = self.client.images.get_registry_data(image_tag).id
+        except docker.errors.APIError as e:
+            self.logger.log(f"Failed to get digest of {image_tag} from the registry, using the local image: {e}",
+                            "warning")
+            return True
 
+        return any(repo_digest.endswith(f"@{digest}") for repo_digest in image.attrs.get("RepoDigests") or [])
+
+    @timed("docker_pull")
     def pull_image(self, image_tag):
-        """Pulls image with specified tag from the Docker Hub"""
+        """Pulls image with specified tag from the Docker Hub, unless the same image is already local.
+
+        Progress of each layer is logged as it is downloaded and extracted.
+        """
+
+        if self.is_image_current(image_tag):
+            self.logger.log(f"Image {image_tag} is already local, skipping pull", "info")
+            return True
+
+        repository, tag = image_tag.rsplit(":", 1)
 
         try:
-            self.client.images.pull(image_tag)
+            for line in self.client.api.pull(repository, tag, stream=True, decode=True):
+                if "error" in line:
+                    raise docker.errors.APIError(line["error"])
+
+                layer = line.get("id")
+                status = line.get("status", "")
+
+                if layer is None:
+                    self.logger.log(f"Pulling {image_tag}: {status}", "info")
+                elif status in ("Pull complete", "Already exists"):
+                    self.logger.end_progress(f"pull:{image_tag}:{layer}")
+                    self.logger.log(f"Layer {layer}: {status}", "info")
+                else:
+                    self.logger.log_progress(f"pull:{image_tag}:{layer}",
+                                             f"Layer {layer}: {status} {line.get('progress', '')}".rstrip(), "info")
+
+            self.logger.log(f"Successfully pulled image {image_tag}", "info")
+            return True
         except Exception as e:
             self.logger.log(f"Failed to pull image {image_tag} with reason: {e}", "error")
+            return False
 
+    @timed("deploy")
     def deploy_image(self, image_tag, port_mapping):
         """Runs the image with specified tag."""
 
-        # Overriding port_mapping for initial feature implementation
-        port_mapping = "5000:5000"
-
         if not image_tag:
             self.logger.log("No image tag provided", "error")
             return None
@@ -689,6 +1828,53 @@ class DockerService:
             self.logger.log(f"An unexpected error occurred: {e}", "error")
             return None
 
+    def wait_until_healthy(self, container_id, port):
+        """Polls the health check of the container until it passes, the container exits or the time runs out.
+
+        The container is healthy when the health check URL responds without an error status and,
+        if its image defines a HEALTHCHECK, Docker reports it healthy.
+        """
+
+        url = f"http://{config.DEPLOY_HOST}:{port}{config.DEPLOY_HEALTH_PATH}"
+        deadline = time.time() + config.DEPLOY_HEALTH_TIMEOUT
+
+        self.logger.log(f"Checking health of container {container_id} at {url}", "info")
+
+        while time.time() < deadline:
+            try:
+                container = self.client.containers.get(container_id)
+                health = container.attrs.get("State", {}).get("Health", {}).get("Status")
+
+                if container.status in ("exited", "dead") or health == "unhealthy":
+                    self.logger.log(f"Container {container_id} is {health or container.status}", "error")
+                    return False
+
+                with urllib.request.urlopen(url, timeout=5) as response:
+                    if response.status < 400 and health in (None, "healthy"):
+                        self.logger.log(f"Container {container_id} is healthy", "info")
+                        return True
+            except (OSError, http.client.HTTPException):
+                pass
+            except docker.errors.APIError as e:
+                self.logger.log(f"Failed to inspect container {container_id}: {e}", "error")
+                return False
+
+            time.sleep(config.DEPLOY_HEALTH_INTERVAL)
+
+        self.logger.log(f"Container {container_id} did not become healthy in {config.DEPLOY_HEALTH_TIMEOUT}s", "error")
+        return False
+
+    def get_host_port(self, container_id, container_port):
+        """Returns host port the container port is published on, None if it is not."""
+
+        try:
+            container = self.client.containers.get(container_id)
+            bindings = container.attrs["NetworkSettings"]["Ports"].get(f"{container_port}/tcp") or []
+            return int(bindings[0]["HostPort"]) if bindings else None
+        except (docker.errors.APIError, KeyError, ValueError) as e:
+            self.logger.log(f"Failed to get published port of container {container_id}: {e}", "error")
+            return None
+
     def stop_running_container(self, container_id):
         """Stops a container by id"""
 
@@ -708,18 +1894,22 @@ class DockerService:
             return False
 
     def run_container(self, container_id):
-        """Runs a container passed by id"""
+        """Runs a container passed by id, unpausing a paused one and starting a stopped one"""
 
         try:
             container = self.client.containers.get(container_id)
-            container.unpause()
-            self.logger.log(f"Container {container_id} unpaused successfully", "info")
+            if container.status == "paused":
+                container.unpause()
+                self.logger.log(f"Container {container_id} unpaused successfully", "info")
+            else:
+                container.start()
+                self.logger.log(f"Container {container_id} started successfully", "info")
             return True
         except docker.errors.NotFound as e:
             self.logger.log(f"Container {container_id} not found: {e}", "error")
             return False
         except docker.errors.APIError as e:
-            self.logger.log(f"Error unpausing container {id}: {e}", "error")
+            self.logger.log(f"Error starting container {container_id}: {e}", "error")
             return False
         except Exception as e:
             self.logger.log(f"An unexpected error occurred: {e}", "error")
@@ -0,0 +1,191 @@
+"""Persistent history of tiny CI/CD pipeline runs kept in SQLite."""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+
+from tiny_cicd_logger import Logger
+
+schema = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    repo_name TEXT NOT NULL,
+    commit_sha TEXT,
+    before_sha TEXT,
+    status TEXT NOT NULL,
+    project_type TEXT,
+    image_tag TEXT,
+    deployed_container_id TEXT,
+    cache_hit INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    finished_at TEXT,
+    details TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS runs_repo_created ON runs (repo_name, created_at);
+CREATE INDEX IF NOT EXISTS runs_commit ON runs (commit_sha);
+CREATE INDEX IF NOT EXISTS runs_created ON runs (created_at);
+CREATE TABLE IF NOT EXISTS stages (
+    run_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    stage TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    PRIMARY KEY (run_id, position)
+);
+"""
+
+
+class RunStore:
+    """Runs, their stages and timings, written by a background thread so the pipeline never waits for disk."""
+
+    logger = Logger("RunStore")
+
+    def __init__(self, path, batch_size=100):
+        self.path = path
+        self.batch_size = batch_size
+        self.pending = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.initialize()
+
+    def connect(self):
+        """Opens a connection to the database, one per thread."""
+
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def initialize(self):
+        """Creates the database and its tables."""
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        connection = self.connect()
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(schema)
+        finally:
+            connection.close()
+
+    def query(self, sql, params=()):
+        """Returns rows of a read-only query."""
+
+        connection = self.connect()
+        try:
+            return connection.execute(sql, params).fetchall()
+        finally:
+            connection.close()
+
+    def start(self):
+        """Starts the thread writing runs to the database."""
+
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.writer_loop, name="tiny-cicd-run-store", daemon=True)
+                self.thread.start()
+
+    def stop(self, timeout=None):
+        """Writes the remaining runs and stops the writer thread."""
+
+        with self.lock:
+            thread = self.thread
+            self.thread = None
+
+        if thread is not None:
+            self.pending.put(None)
+            thread.join(timeout)
+
+    def save(self, context):
+        """Queues the current state of the run to be written."""
+
+        self.start()
+        self.pending.put(context.to_dict())
+
+    def writer_loop(self):
+        """Writes queued runs in batches, each run only in its latest state."""
+
+        connection = self.connect()
+
+        try:
+            while True:
+                batch = [self.pending.get()]
+                while len(batch) < self.batch_size and not self.pending.empty():
+                    batch.append(self.pending.get())
+
+                stopping = None in batch
+                runs = {run["run_id"]: run for run in batch if run is not None}
+
+                try:
+                    with connection:
+                        for run in runs.values():
+                            self.write_run(connection, run)
+                except sqlite3.Error as e:
+                    self.logger.log(f"Failed to store {len(runs)} run(s): {e}", "error")
+
+                if stopping:
+                    return
+        finally:
+            connection.close()
+
+    @staticmethod
+    def write_run(connection, run):
+        """Inserts or updates a run and its stages."""
+
+        connection.execute(
+            "INSERT OR REPLACE INTO runs (run_id, kind, repo_name, commit_sha, before_sha, status, project_type,"
+            " image_tag, deployed_container_id, cache_hit, error, created_at, finished_at, details)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (run["run_id"], run["kind"], run["repo_name"], run["commit"], run["before"], run["status"],
+             run["project_type"], run["image_tag"], run["deployed_container_id"], int(run["cache_hit"]),
+             run["error"], run["created_at"], run["finished_at"], json.dumps(run)))
+
+        stages = run["stages"]
+        connection.executemany(
+            "INSERT OR REPLACE INTO stages (run_id, position, stage, started_at, finished_at) VALUES (?, ?, ?, ?, ?)",
+            [(run["run_id"], position, stage["stage"], stage["started_at"],
+              stages[position + 1]["started_at"] if position + 1 < len(stages) else run["finished_at"])
+             for position, stage in enumerate(stages)])
+
+    def get_run(self, run_id):
+        """Returns details of a stored run or None."""
+
+        rows = self.query("SELECT details FROM runs WHERE run_id = ?", (run_id,))
+
+        return json.loads(rows[0]["details"]) if rows else None
+
+    def get_runs(self, repo_name=None, commit=None, kind=None, limit=20, offset=0):
+        """Returns a page of stored runs, newest first, and the amount of all matching runs."""
+
+        conditions = []
+        params = []
+
+        for column, value in (("repo_name", repo_name), ("kind", kind)):
+            if value:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+
+        if commit:
+            # Webhooks give full SHAs while image tags carry abbreviated ones, GLOB keeps using the index
+            conditions.append("commit_sha GLOB ?")
+            params.append(f"{commit}*")
+
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        total = self.query(f"SELECT COUNT(*) FROM runs{where}", params)[0][0]
+        rows = self.query(f"SELECT details FROM runs{where} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+                          params + [limit, offset])
+
+        return [json.loads(row["details"]) for row in rows], total
+
+    def get_latest(self, kind, column):
+        """Returns the value of the column of the latest finished run of each repository having one."""
+
+        rows = self.query(f"SELECT repo_name, {column}, MAX(created_at) FROM runs"
+                          f" WHERE kind = ? AND status = 'FINISHED' AND {column} IS NOT NULL GROUP BY repo_name",
+                          (kind,))
+
+        return {row["repo_name"]: row[column] for row in rows}
@@ -0,0 +1,236 @@
+"""Test units of the supported project types, used to run a subset of the test suite."""
+
+import os
+import re
+
+# Directories never containing tests of the project
+skipped_directories = {".git", "node_modules", "target", "bin", "obj", "vendor", "__pycache__", ".venv", "venv"}
+
+# Duration assumed for test units without history
+default_unit_seconds = 1.0
+
+# Files whose change can affect any test, forcing the whole suite to run
+build_files = {"pom.xml", "requirements.txt", "setup.py", "setup.cfg", "pyproject.toml", "tox.ini", "pytest.ini",
+               "conftest.py", "go.mod", "go.sum", "Dockerfile", ".dockerignore"}
+
+# Extensions of files which never affect tests
+documentation_extensions = (".md", ".rst", ".adoc")
+
+# Extensions of source files mapped to affected tests per project type
+source_extensions = {"PYTHON": ".py", "MAVEN": ".java", "GO": ".go"}
+
+
+def walk_files(directory):
+    """Yields paths of the project files relative to its directory."""
+
+    for root, directories, files in os.walk(directory):
+        directories[:] = [name for name in directories if name not in skipped_directories]
+        for name in files:
+            yield os.path.relpath(os.path.join(root, name), directory).replace(os.sep, "/")
+
+
+def is_python_test_file(path):
+    """Checks if the file is collected by pytest by default."""
+    name = path.rsplit("/", 1)[-1]
+    return name.endswith(".py") and (name.startswith("test_") or name.endswith("_test.py"))
+
+
+def is_maven_test_file(path):
+    """Checks if the file is a test class run by surefire by default."""
+    name = path.rsplit("/", 1)[-1]
+    if not path.startswith("src/test/java/") or not name.endswith(".java"):
+        return False
+    class_name = name[:-5]
+    return class_name.startswith("Test") or class_name.endswith(("Test", "Tests", "TestCase"))
+
+
+def discover_test_units(project_type, directory):
+    """Returns sorted test units of the project, None if its tests cannot be split.
+
+    Units are test files for Python, test classes for Maven and packages for Go.
+    """
+
+    if project_type == "PYTHON":
+        return sorted(path for path in walk_files(directory) if is_python_test_file(path))
+
+    if project_type == "MAVEN":
+        return sorted(path[len("src/test/java/"):-len(".java")].replace("/", ".")
+                      for path in walk_files(directory) if is_maven_test_file(path))
+
+    if project_type == "GO":
+        packages = set()
+        for path in walk_files(directory):
+            if path.endswith("_test.go"):
+                package = path.rsplit("/", 1)[0] if "/" in path else ""
+                packages.add(f"./{package}" if package else ".")
+        return sorted(packages)
+
+    return None
+
+
+def unit_matches_suite(project_type, unit, suite):
+    """Checks if a test suite from the reports belongs to the test unit."""
+
+    if project_type == "PYTHON":
+        module = unit[:-len(".py")].replace("/", ".")
+        return suite == module or suite.startswith(f"{module}.")
+
+    if project_type == "MAVEN":
+        return suite == unit or suite.startswith(f"{unit}$")
+
+    if project_type == "GO":
+        # Import path of the root package depends on the module name, it falls back to the average duration
+        return unit != "." and suite.endswith(unit[1:])
+
+    return False
+
+
+def get_unit_durations(project_type, units, durations):
+    """Sums durations of the tests recorded in history per test unit."""
+
+    unit_durations = {}
+
+    for unit in units:
+        seconds = [value for key, value in durations.items()
+                   if unit_matches_suite(project_type, unit, key.split("::", 1)[0])]
+        if seconds:
+            unit_durations[unit] = sum(seconds)
+
+    return unit_durations
+
+
+def balance_shards(units, unit_durations, shard_count):
+    """Splits units into shards of similar total duration, longest units first.
+
+    Units without history are assumed to take as long as an average known unit.
+    """
+
+    if unit_durations:
+        fallback = sum(unit_durations.values()) / len(unit_durations)
+    else:
+        fallback = default_unit_seconds
+
+    shards = [[] for _ in range(min(shard_count, len(units)))]
+    totals = [0.0] * len(shards)
+
+    for unit in sorted(units, key=lambda name: unit_durations.get(name, fallback), reverse=True):
+        index = totals.index(min(totals))
+        shards[index].append(unit)
+        totals[index] += unit_durations.get(unit, fallback)
+
+    return [sorted(shard) for shard in shards]
+
+
+def get_unit_files(project_type, unit, directory):
+    """Returns paths of the files the test unit consists of, relative to the project directory."""
+
+    if project_type == "PYTHON":
+        return [unit]
+
+    if project_type == "MAVEN":
+        return [f"src/test/java/{unit.replace('.', '/')}.java"]
+
+    if project_type == "GO":
+        package_directory = os.path.join(directory, unit)
+        prefix = "" if unit == "." else f"{unit[2:]}/"
+        return [f"{prefix}{name}" for name in sorted(os.listdir(package_directory)) if name.endswith(".go")]
+
+    return []
+
+
+def get_changed_symbol(project_type, path):
+    """Returns the name tests refer to the changed source file by."""
+
+    name = path.rsplit("/", 1)[-1]
+
+    if project_type == "PYTHON":
+        return "__init__" if name == "__init__.py" else name[:-len(".py")]
+
+    if project_type == "MAVEN":
+        return name[:-len(".java")]
+
+    if project_type == "GO":
+        return path.rsplit("/", 1)[0] if "/" in path else None
+
+    return None
+
+
+def refers_to(project_type, content, symbol):
+    """Checks if the source of a test unit refers to the changed symbol."""
+
+    if project_type == "PYTHON":
+        return re.search(rf"^\s*(from|import)\s[^#\n]*\b{re.escape(symbol)}\b", content, re.MULTILINE) is not None
+
+    if project_type == "MAVEN":
+        return re.search(rf"\b{re.escape(symbol)}\b", content) is not None
+
+    if project_type == "GO":
+        return re.search(rf'"[^"\n]*/{re.escape(symbol)}"', content) is not None
+
+    return False
+
+
+def select_affected_units(project_type, directory, units, changed_files):
+    """Returns test units affected by the changed files, None if the whole suite has to run.
+
+    A unit is affected when one of its files changed or when it refers to a changed source file:
+    imports the changed module for Python, mentions the changed class for Maven and imports the
+    changed package for Go.
+    """
+
+    extension = source_extensions.get(project_type)
+
+    if extension is None or units is None:
+        return None
+
+    unit_files = {unit: get_unit_files(project_type, unit, directory) for unit in units}
+    affected = set()
+    changed_symbols = set()
+
+    for path in changed_files:
+        name = path.rsplit("/", 1)[-1]
+
+        if name in build_files:
+            return None
+        if name.endswith(documentation_extensions) or path.startswith("docs/"):
+            continue
+        if not name.endswith(extension):
+            return None
+
+        affected |= {unit for unit, files in unit_files.items() if path in files}
+
+        symbol = get_changed_symbol(project_type, path)
+        if symbol == "__init__":
+            return None
+        if symbol is not None:
+            changed_symbols.add(symbol)
+
+    for unit, files in unit_files.items():
+        if unit in affected:
+            continue
+        for path in files:
+            try:
+                with open(os.path.join(directory, path), 'r', encoding="UTF-8", errors="replace") as file:
+                    content = file.read()
+            except OSError:
+                continue
+            if any(refers_to(project_type, content, symbol) for symbol in changed_symbols):
+                affected.add(unit)
+                break
+
+    return sorted(affected)
+
+
+def get_test_command(project_type, units):
+    """Returns command running only the given test units with the test-runner template."""
+
+    if project_type == "PYTHON":
+        return ["pytest", "--junitxml=/app/test-reports/junit.xml"] + list(units)
+
+    if project_type == "MAVEN":
+        return ["mvn", "test", f"-Dtest={','.join(units)}", "-Dsurefire.failIfNoSpecifiedTests=false"]
+
+    if project_type == "GO":
+        return ["go", "test", "-v"] + list(units)
+
+    return None
@@ -0,0 +1,140 @@
+"""Pool of git worktrees for tiny CI/CD pipeline runs."""
+
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+
+from tiny_cicd_logger import Logger
+import tiny_cicd_metrics as metrics
+
+
+class Worktree:
+    """Worktree of a repository mirror checked out at a single commit."""
+
+    def __init__(self, path, commit=None, last_used=None):
+        self.path = path
+        self.commit = commit
+        self.busy = False
+        self.last_used = last_used or time.time()
+
+
+class WorktreePool:
+    """Worktrees of repository mirrors, one per run, reused across runs.
+
+    Each run gets a worktree of its own, preferably one already checked out at the
+    same commit. Free worktrees above the pool size are removed least recently used first.
+    """
+
+    logger = Logger("WorktreePool")
+
+    def __init__(self, root_directory, size):
+        self.root_directory = root_directory
+        self.size = size
+        self.worktrees = {}
+        self.mirror_locks = {}
+        self.lock = threading.Lock()
+
+    def get_mirror_lock(self, mirror_directory):
+        """Returns lock guarding fetches and worktree changes of a mirror."""
+
+        with self.lock:
+            if mirror_directory not in self.mirror_locks:
+                self.mirror_locks[mirror_directory] = threading.Lock()
+            return self.mirror_locks[mirror_directory]
+
+    def get_worktrees(self, repo_name):
+        """Returns worktrees of the repository, picking up the ones left on disk by a previous run."""
+
+        if repo_name not in self.worktrees:
+            worktrees = []
+            repo_directory = os.path.join(self.root_directory, repo_name)
+            if os.path.isdir(repo_directory):
+                for name in os.listdir(repo_directory):
+                    path = os.path.join(repo_directory, name)
+                    worktrees.append(Worktree(path, last_used=os.path.getmtime(path)))
+            self.worktrees[repo_name] = worktrees
+        return self.worktrees[repo_name]
+
+    def acquire(self, repo_name, mirror_directory, commit):
+        """Returns path of a worktree checked out at the commit, reserved until released."""
+
+        with self.lock:
+            worktrees = self.get_worktrees(repo_name)
+            free = [worktree for worktree in worktrees if not worktree.busy]
+            same_commit = [worktree for worktree in free if worktree.commit == commit]
+
+            if same_commit:
+                worktree = same_commit[0]
+            elif free and len(worktrees) >= self.size:
+                worktree = min(free, key=lambda candidate: candidate.last_used)
+            else:
+                worktree = Worktree(os.path.join(self.root_directory, repo_name, uuid.uuid4().hex[:12]))
+                worktrees.append(worktree)
+
+            worktree.busy = True
+
+        metrics.cache_requests.inc(cache="worktree", result="hit" if same_commit else "miss")
+
+        try:
+            self.checkout(worktree, mirror_directory, commit)
+        except Exception:
+            self.release(repo_name, worktree.path, mirror_directory)
+            raise
+
+        return worktree.path
+
+    def checkout(self, worktree, mirror_directory, commit):
+        """Checks the worktree out at the commit, creating it if needed."""
+
+        if os.path.exists(os.path.join(worktree.path, ".git")):
+            self.logger.log(f"Checking out {commit} in {worktree.path}", "info")
+            subprocess.check_call(["git", "checkout", "--quiet", "--detach", "--force", commit], cwd=worktree.path)
+            subprocess.check_call(["git", "clean", "--quiet", "-fdx"], cwd=worktree.path)
+        else:
+            self.logger.log(f"Creating worktree {worktree.path} at {commit}", "info")
+            with self.get_mirror_lock(mirror_directory):
+                if os.path.exists(worktree.path):
+                    shutil.rmtree(worktree.path)
+                subprocess.check_call(["git", "worktree", "prune"], cwd=mirror_directory)
+                subprocess.check_call(["git", "worktree", "add", "--quiet", "--detach", "--force", worktree.path,
+                                       commit], cwd=mirror_directory)
+
+        worktree.commit = commit
+
+    def release(self, repo_name, path, mirror_directory):
+        """Returns the worktree to the pool and evicts the least recently used ones above the pool size."""
+
+        with self.lock:
+            for worktree in self.get_worktrees(repo_name):
+                if worktree.path == path:
+                    worktree.busy = False
+                    worktree.last_used = time.time()
+
+            evicted = []
+            worktrees = self.worktrees[repo_name]
+            free = sorted((worktree for worktree in worktrees if not worktree.busy),
+                          key=lambda candidate: candidate.last_used)
+
+            while len(worktrees) > self.size and free:
+                worktree = free.pop(0)
+                worktrees.remove(worktree)
+                evicted.append(worktree)
+
+        for worktree in evicted:
+            self.remove(worktree, mirror_directory)
+
+    def remove(self, worktree, mirror_directory):
+        """Removes the worktree from disk and from the mirror."""
+
+        self.logger.log(f"Removing worktree {worktree.path}", "info")
+
+        with self.get_mirror_lock(mirror_directory):
+            try:
+                subprocess.check_call(["git", "worktree", "remove", "--force", worktree.path], cwd=mirror_directory)
+            except subprocess.CalledProcessError as e:
+                self.logger.log(f"Failed to remove worktree {worktree.path}: {e}", "error")
+                shutil.rmtree(worktree.path, ignore_errors=True)
+                subprocess.call(["git", "worktree", "prune"], cwd=mirror_directory)